@@ -1,34 +1,73 @@
-from flask import Flask
+import os
+from flask import Flask, request
 from flask_restful import Api
-from models import database
+from models import database, orders_database, STORAGE_PROFILE
+import hashing
+import pictures
+import writer
 
-from views import item
-from views.order import OrderResource, OrdersResource
-from views.user import UserResource, UsersResource
+from views import item, picture
+from views.stats import StatsResource
+from views.order import OrderResource, OrdersResource, OrdersBatchResource
+from views.user import UserResource, UsersResource, LoginResource
 from views.address import AddressResource, AddressesResource
 
 app = Flask(__name__)
 api = Api(app)
 
+# Requests only reading the database get read-only connections
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
 
+# Funnel every write through a single writer thread that group commits them,
+# on its own connection, plus one writer for each order shard. Always on in
+# the WAL profile, where the request connections only compete for reads.
+if os.environ.get('ECOMMERCE_WRITE_COORDINATOR') or STORAGE_PROFILE == 'wal':
+    writer.start()
+
+# Hash and verify the passwords in a pool of worker processes
+if os.environ.get('ECOMMERCE_HASH_WORKERS'):
+    hashing.start(
+        workers=int(os.environ['ECOMMERCE_HASH_WORKERS']),
+        max_pending=int(os.environ.get('ECOMMERCE_HASH_MAX_PENDING', 0)) or None)
+
+# Make the thumbnails of the uploaded pictures on background threads
+pictures.start(workers=int(os.environ.get(
+    'ECOMMERCE_THUMBNAIL_WORKERS', pictures.THUMBNAIL_WORKERS)))
+
+# Let the front proxy send the picture files
+app.config['USE_X_SENDFILE'] = bool(os.environ.get('ECOMMERCE_X_SENDFILE'))
+
+
+# Borrow a pooled connection for the request and give it back afterwards,
+# the connections stay open in the pool
 @app.before_request
 def database_connect():
     if database.is_closed():
-        database.connect()
+        database.connect(read_only=request.method in READ_METHODS)
 
 
 @app.teardown_request
 def database_disconnect(response):
     if not database.is_closed():
         database.close()
+    # The order shards are connected to on their first query
+    orders_database.close_shards()
     return response
 
 
 api.add_resource(item.ItemsResource, '/items/')
+api.add_resource(item.ItemsImportResource, '/items/import')
+api.add_resource(item.ItemFacetsResource, '/items/facets')
+api.add_resource(item.ItemSearchResource, '/items/search')
 api.add_resource(item.ItemResource, '/item/<uuid:uuid>')
+api.add_resource(picture.ItemPicturesResource, '/item/<uuid:item_id>/pictures')
+api.add_resource(picture.PictureResource, '/pictures/<uuid:uuid>')
+api.add_resource(LoginResource, '/login')
 api.add_resource(UsersResource, '/users/')
 api.add_resource(UserResource, '/users/<uuid:uuid>')
 api.add_resource(OrdersResource, '/orders/')
+api.add_resource(OrdersBatchResource, '/orders/batch')
 api.add_resource(OrderResource, '/orders/<uuid:uuid>')
 api.add_resource(AddressesResource, '/addresses/')
 api.add_resource(AddressResource, '/addresses/<uuid:address_id>')
+api.add_resource(StatsResource, '/stats')
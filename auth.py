@@ -1,21 +1,122 @@
-from flask_httpauth import HTTPBasicAuth
+import hashlib
+import hmac
+import os
+import threading
+import uuid
+from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth, MultiAuth
+from itsdangerous import URLSafeTimedSerializer, BadData
+from werkzeug.local import LocalProxy
+from cache import TTLCache
 from models import User
 from flask import g
 
+CREDENTIALS_CACHE_SIZE = 10000
+CREDENTIALS_CACHE_TTL = 60
 
-login_manager = HTTPBasicAuth()
+TOKEN_TTL = 60 * 60
+
+basic_auth = HTTPBasicAuth()
+token_auth = HTTPTokenAuth('Bearer')
+# Either the Basic credentials or a Bearer token from /login
+login_manager = MultiAuth(basic_auth, token_auth)
 login_required = login_manager.login_required
 
+# Key signing the tokens. Without ECOMMERCE_SECRET_KEY a random one is used,
+# so the tokens are only valid in the process that issued them.
+SECRET_KEY = os.environ.get('ECOMMERCE_SECRET_KEY') or os.urandom(32)
+tokens = URLSafeTimedSerializer(SECRET_KEY, salt='auth-token')
+
+# Users whose credentials were verified recently, by credentials digest, so
+# that repeated requests skip the password hashing. The cache is local to
+# the process: a password changed through another process keeps working
+# here until its entry expires.
+credentials = TTLCache(maxsize=CREDENTIALS_CACHE_SIZE, ttl=CREDENTIALS_CACHE_TTL)
+
+# Secret of the digests, so that the cache keys cannot be checked against
+# guessed passwords
+_salt = os.urandom(32)
+
+# Bumped by every invalidation so that a verification racing with a
+# password change does not cache the old credentials
+_generation = 0
+_lock = threading.Lock()
+
+
+def credentials_key(email, password):
+    # The length keeps the email and password boundary unambiguous
+    message = '{}:{}:{}'.format(len(email), email, password).encode()
+    return hmac.new(_salt, message, hashlib.sha256).digest()
+
+
+def invalidate(user):
+    """Forget the verified credentials of `user`, once its change is committed."""
+    global _generation
+    with _lock:
+        _generation += 1
+        credentials.discard_if(lambda cached: cached.id == user.id)
+
+
+def generate_token(user):
+    """
+    Return a signed token authenticating `user` for TOKEN_TTL seconds. The
+    uuid identifies the user, as the ids of deleted users are reused.
+    """
+    return tokens.dumps({'uuid': str(user.uuid)})
+
+
+def set_current_user(user_uuid, user=None):
+    """
+    Store the authenticated user in `g`: its uuid in g.current_user_uuid and
+    the row in g.current_user, loaded on first use when it is not given.
+    """
+    g.current_user_uuid = user_uuid
+    if user is None:
+        user = LocalProxy(_user_loader(user_uuid))
+    g.current_user = user
 
-@login_manager.verify_password
+
+def _user_loader(user_uuid):
+    loaded = []
+
+    def load():
+        if not loaded:
+            loaded.append(User.get(User.uuid == user_uuid))
+        return loaded[0]
+    return load
+
+
+@token_auth.verify_token
+def verify_token(token):
+    # The signature and age of the token are checked without querying
+    try:
+        data = tokens.loads(token, max_age=TOKEN_TTL)
+        user_uuid = uuid.UUID(data['uuid'])
+    except (BadData, TypeError, KeyError, ValueError, AttributeError):
+        return False
+
+    set_current_user(user_uuid)
+    return True
+
+
+@basic_auth.verify_password
 def verify_pw(email, password):
+    key = credentials_key(email, password)
+    user = credentials.get(key)
+    if user is not None:
+        set_current_user(user.uuid, user)
+        return True
+
+    generation = _generation
     try:
         user = User.get(User.email == email)
     except User.DoesNotExist:
         return False
 
     if user.verify_password(password):
-        g.current_user = user
+        with _lock:
+            if generation == _generation:
+                credentials.set(key, user)
+        set_current_user(user.uuid, user)
         return True
 
     return False
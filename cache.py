@@ -0,0 +1,94 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Thread safe mapping holding at most `maxsize` entries, each one expiring
+    `ttl` seconds after it was set. The least recently used entry is evicted
+    first when the cache is full.
+    """
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._get(key)
+            if value is _missing:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def add(self, key, value):
+        """Set `key` only if it is not already cached, returning whether it was."""
+        with self._lock:
+            if self._get(key) is not _missing:
+                return False
+            self._set(key, value)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            value = self._get(key)
+            if value is _missing:
+                return default
+            del self._data[key]
+            return value
+
+    def discard_if(self, predicate):
+        """Remove the entries whose value satisfies `predicate`, returning how many."""
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+    def _get(self, key):
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            return _missing
+
+        if expires <= self._clock():
+            del self._data[key]
+            return _missing
+
+        self._data.move_to_end(key)
+        return value
+
+    def _set(self, key, value):
+        self._data[key] = (self._clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+_missing = object()
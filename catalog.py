@@ -0,0 +1,149 @@
+import json
+import threading
+
+from cache import TTLCache
+from models import Item
+import utils
+
+CACHE_SIZE = 10000
+CACHE_TTL = 60
+
+# Read-through cache of the items, by uuid, kept up to date by the item
+# resources. It is local to the process, so an entry is checked against the
+# row version in the database before it is reused.
+items = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+# The whole catalog, as listed by GET /items/, along with the version of
+# the item table it was read at
+item_list = TTLCache(maxsize=1, ttl=CACHE_TTL)
+# Encoded JSON of the items, by uuid, along with the version it encodes
+fragments = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+
+_ALL = 'all'
+
+# Bumped by every write so that a read racing with it does not cache the
+# row it loaded before the write.
+_generation = 0
+_lock = threading.Lock()
+
+
+def get_item(item_uuid):
+    """
+    Return the item with `item_uuid` or raise Item.DoesNotExist. The cached
+    row is only reused while its version is the one in the database, so
+    that the writes of other processes are seen at once.
+    """
+    versions = list(Item.select(Item.version).where(Item.uuid == item_uuid).tuples())
+    if not versions:
+        items.pop(str(item_uuid))
+        raise Item.DoesNotExist()
+
+    item = items.get(str(item_uuid))
+    if item is not None and item.version == versions[0][0]:
+        return item
+
+    generation = _generation
+    item = Item.get(Item.uuid == item_uuid)
+    _fill(generation, [item])
+    return item
+
+
+def get_items(items_uuid):
+    """
+    Map the uuids of the existing items among `items_uuid` to the items.
+    As in get_item, the cached rows are checked against the row versions in
+    the database, so that orders are priced with the current prices.
+    """
+    versions = {}
+    for batch in utils.chunked(items_uuid, utils.IN_BATCH_SIZE):
+        query = Item.select(Item.uuid, Item.version).where(Item.uuid << batch).tuples()
+        versions.update((str(item_uuid), version) for item_uuid, version in query)
+
+    found = {}
+    missing = []
+    for item_uuid, version in versions.items():
+        item = items.get(item_uuid)
+        if item is not None and item.version == version:
+            found[item_uuid] = item
+        else:
+            missing.append(item_uuid)
+
+    generation = _generation
+    for batch in utils.chunked(missing, utils.IN_BATCH_SIZE):
+        loaded = list(Item.select().where(Item.uuid << batch))
+        _fill(generation, loaded)
+        found.update((str(item.uuid), item) for item in loaded)
+
+    return found
+
+
+def get_item_list(version):
+    """
+    Return every item, as of `version` of the item table or later. The
+    version must be read before calling, so that the cached list is only
+    reused while no process has written to the table since.
+    """
+    cached = item_list.get(_ALL)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    generation = _generation
+    all_items = list(Item.select().order_by(Item.id))
+    with _lock:
+        if generation == _generation:
+            item_list.set(_ALL, (version, all_items))
+    return all_items
+
+
+def fragment(item):
+    """Return the JSON encoding of `item`, as bytes, encoding it only once."""
+    key = str(item.uuid)
+    cached = fragments.get(key)
+    if cached is not None and cached[0] == item.version:
+        return cached[1]
+
+    encoded = json.dumps(item.json()).encode()
+    fragments.set(key, (item.version, encoded))
+    return encoded
+
+
+def update(item):
+    """Store the item just written, to be called once it is committed."""
+    global _generation
+    with _lock:
+        _generation += 1
+        items.set(str(item.uuid), item)
+        fragments.pop(str(item.uuid))
+        item_list.clear()
+
+
+def invalidate(item_uuid):
+    global _generation
+    with _lock:
+        _generation += 1
+        items.pop(str(item_uuid))
+        fragments.pop(str(item_uuid))
+        item_list.clear()
+
+
+def clear():
+    global _generation
+    with _lock:
+        _generation += 1
+        items.clear()
+        item_list.clear()
+        fragments.clear()
+
+
+def stats():
+    return {
+        'items': items.stats(),
+        'item_list': item_list.stats(),
+        'fragments': fragments.stats(),
+    }
+
+
+def _fill(generation, loaded):
+    with _lock:
+        if generation == _generation:
+            for item in loaded:
+                items.set(str(item.uuid), item)
@@ -0,0 +1,49 @@
+from http.client import NOT_MODIFIED
+import zlib
+
+from flask import request, Response
+from werkzeug.http import quote_etag
+
+from models import TableVersion
+from shards import ShardRouter
+
+
+def row_etag(obj):
+    """
+    ETag of `obj` for the current query string, which can select its fields,
+    changing with every save of the row.
+    """
+    return '{}-{}-{:x}'.format(obj.uuid, obj.version, zlib.crc32(request.query_string))
+
+
+def table_etag(model, version=None):
+    """
+    ETag of a listing of `model` for the current query string, changing
+    with every write to the table. `version` is the table version when it
+    was already read.
+    """
+    if version is None:
+        version = table_version(model)
+    return '{}-{}-{:x}'.format(
+        model._meta.db_table, version, zlib.crc32(request.query_string))
+
+
+def table_version(model):
+    name = model._meta.db_table
+    database = model._meta.database
+    if isinstance(database, ShardRouter):
+        # The versions only grow, so their sum changes with every write to
+        # any of the shards
+        return sum(TableVersion.current(name, shard) for shard in database.databases)
+    return TableVersion.current(name)
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already has `etag`, else None."""
+    if request.if_none_match.contains(etag):
+        return Response(status=NOT_MODIFIED, headers=headers(etag))
+    return None
+
+
+def headers(etag):
+    return {'ETag': quote_etag(etag)}
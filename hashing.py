@@ -0,0 +1,117 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import threading
+
+from passlib.hash import pbkdf2_sha256
+from werkzeug.exceptions import ServiceUnavailable
+
+# Jobs handed to the pool at once, by worker, the others wait for a slot
+PENDING_PER_WORKER = 4
+# Seconds a job waits for a slot before the request is turned down
+SLOT_TIMEOUT = 5
+
+
+class HashingBusy(ServiceUnavailable):
+    description = 'Too many password operations are pending, retry later.'
+
+
+def _hash(password):
+    return pbkdf2_sha256.hash(password)
+
+
+def _verify(password, password_hash):
+    return pbkdf2_sha256.verify(password, password_hash)
+
+
+class HashingPool:
+    """
+    Process pool running the password key derivations, so that they neither
+    block the request threads nor hold the GIL. At most `max_pending` jobs
+    are handed to the pool, the others wait up to `timeout` seconds for a
+    slot and then raise HashingBusy.
+    """
+
+    def __init__(self, workers=None, max_pending=None, timeout=SLOT_TIMEOUT):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * PENDING_PER_WORKER
+        self.timeout = timeout
+        self.completed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def stop(self):
+        self._executor.shutdown()
+        self._executor = None
+
+    def run(self, fn, *args):
+        with self._lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=self.timeout)
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.in_flight += 1
+            else:
+                self.rejected += 1
+        if not acquired:
+            raise HashingBusy()
+
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
+
+
+_pool = None
+
+
+def start(**kwargs):
+    global _pool
+    _pool = HashingPool(**kwargs)
+    _pool.start()
+
+
+def stop():
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
+
+def stats():
+    return None if _pool is None else _pool.stats()
+
+
+def _run(fn, *args):
+    if _pool is None:
+        return fn(*args)
+    return _pool.run(fn, *args)
+
+
+def hash_password(password):
+    """Hash `password`, in the pool when it is running or right away otherwise."""
+    return _run(_hash, password)
+
+
+def verify_password(password, password_hash):
+    return _run(_verify, password, password_hash)
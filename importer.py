@@ -0,0 +1,131 @@
+import codecs
+import csv
+import json
+import uuid
+
+from models import Item, TableVersion
+import catalog
+import utils
+import writer
+
+# Item rows carry 6 columns
+CHUNK_SIZE = utils.insert_batch_size(6)
+# Row errors reported back, the following ones are only counted
+MAX_ERRORS = 1000
+
+FIELDS = ('name', 'price', 'description', 'category')
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def decode_lines(stream):
+    return codecs.iterdecode(stream, 'utf-8', errors='replace')
+
+
+def read_ndjson(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            yield InvalidRow('Invalid JSON: {}'.format(exc))
+
+
+def read_csv(lines):
+    return csv.DictReader(lines)
+
+
+def parse_row(row):
+    """
+    Validate an item row with the rules of ItemsResource.post and return
+    its uuid, a new one unless given, and its fields.
+    """
+    if isinstance(row, InvalidRow):
+        raise row
+    if not isinstance(row, dict):
+        raise InvalidRow('The row is not an object')
+
+    unknown = set(row) - set(FIELDS) - {'uuid'}
+    if unknown:
+        raise InvalidRow('Unknown fields: {}'.format(', '.join(sorted(map(str, unknown)))))
+    missing = [field for field in FIELDS if row.get(field) is None]
+    if missing:
+        raise InvalidRow('Missing fields: {}'.format(', '.join(missing)))
+
+    try:
+        item_uuid = uuid.UUID(str(row['uuid'])) if row.get('uuid') else uuid.uuid4()
+        price = int(row['price'])
+        name = utils.non_empty_str(row['name'], 'name')
+    except (TypeError, ValueError) as exc:
+        raise InvalidRow(str(exc))
+
+    return str(item_uuid), {
+        'name': name,
+        'price': price,
+        'description': str(row['description']),
+        'category': str(row['category']),
+    }
+
+
+def import_items(rows, chunk_size=CHUNK_SIZE):
+    """
+    Insert or update, by uuid, the items of the `rows` iterable in chunked
+    transactions, holding a single chunk in memory at a time. Return a report
+    of the rows created, updated and failed, with the reason of the failures.
+    """
+    report = {'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+
+    def fail(number, error):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_ERRORS:
+            report['errors'].append({'row': number, 'error': error})
+
+    def valid_rows():
+        for number, row in enumerate(rows, 1):
+            try:
+                yield number, parse_row(row)
+            except InvalidRow as exc:
+                fail(number, str(exc))
+
+    for chunk in utils.chunked(valid_rows(), chunk_size):
+        try:
+            created, updated = writer.submit(_upsert, chunk)
+        except Exception as exc:
+            for number, _ in chunk:
+                fail(number, str(exc))
+            continue
+        report['created'] += created
+        report['updated'] += updated
+
+    if report['created'] or report['updated']:
+        catalog.clear()
+
+    return report
+
+
+def _upsert(chunk):
+    # The last row wins when a uuid is repeated within the chunk
+    rows = dict(parsed for _, parsed in chunk)
+
+    with Item._meta.database.atomic():
+        existing = dict(
+            (str(item_uuid), item_id) for item_id, item_uuid in
+            Item.select(Item.id, Item.uuid).where(Item.uuid << list(rows)).tuples())
+
+        new_rows = [dict(fields, uuid=item_uuid, version=1)
+                    for item_uuid, fields in rows.items() if item_uuid not in existing]
+        if new_rows:
+            Item.insert_many(new_rows).execute()
+
+        # Bump the versions like Item.save() does, for the ETags and caches
+        for item_uuid, item_id in existing.items():
+            (Item
+             .update(version=Item.version + 1, **rows[item_uuid])
+             .where(Item.id == item_id)
+             .execute())
+        TableVersion.bump(Item._meta.db_table)
+
+    return len(new_rows), len(chunk) - len(new_rows)
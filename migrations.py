@@ -0,0 +1,243 @@
+import datetime
+import uuid
+
+from peewee import fn, OperationalError, UUIDField
+
+from models import Item, User, Address, Order, OrderItem, Picture, TableVersion
+from models import IdempotencyKey
+import search
+
+CONVERSION_BATCH_SIZE = 1000
+
+UUID_MODELS = [Item, User, Address, Order, Picture]
+
+MIGRATIONS_TABLE = 'schemamigration'
+
+# Schema migrations, applied in order to a live database and recorded in the
+# migrations table. They only add tables, columns and indexes, and check what
+# already exists, so that they also run on a database created from the
+# current models. They skip the tables a database does not have, so that
+# they run on the main database and on the order shards alike.
+MIGRATIONS = []
+
+
+def migration(function):
+    """Register `function(database)` as the next migration."""
+    MIGRATIONS.append(function)
+    return function
+
+
+def tables(database):
+    cursor = database.execute_sql('SELECT "name" FROM "sqlite_master" WHERE "type" = ?', ('table',))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def columns(database, table):
+    cursor = database.execute_sql('PRAGMA table_info("{}")'.format(table))
+    return {row[1] for row in cursor.fetchall()}
+
+
+def add_column(database, model, column, definition):
+    """Add a column, with its SQL `definition`, unless it is already there."""
+    table = model._meta.db_table
+    existing = columns(database, table)
+    if existing and column not in existing:
+        database.execute_sql('ALTER TABLE "{}" ADD COLUMN "{}" {}'.format(
+            table, column, definition))
+
+
+def add_index(database, model, fields, unique=False):
+    """Add an index named as peewee names those of the model declarations."""
+    table = model._meta.db_table
+    if table not in tables(database):
+        return
+    column_names = [model._meta.fields[field].db_column for field in fields]
+    database.execute_sql('CREATE {}INDEX IF NOT EXISTS "{}" ON "{}" ({})'.format(
+        'UNIQUE ' if unique else '',
+        '{}_{}'.format(table, '_'.join(column_names)),
+        table,
+        ', '.join('"{}"'.format(column) for column in column_names)))
+
+
+@migration
+def add_table_versions(database):
+    database.execute_sql(
+        'CREATE TABLE IF NOT EXISTS "{}" ("id" INTEGER NOT NULL PRIMARY KEY, '
+        '"name" VARCHAR(255) NOT NULL, "version" INTEGER NOT NULL)'.format(
+            TableVersion._meta.db_table))
+    add_index(database, TableVersion, ['name'], unique=True)
+
+
+@migration
+def add_row_versions(database):
+    for model in [Item, Address, Order]:
+        add_column(database, model, 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+
+@migration
+def add_order_snapshots(database):
+    # The orders written before have none and are still read from their rows
+    add_column(database, Order, 'snapshot', 'TEXT')
+
+
+@migration
+def add_item_listing_indexes(database):
+    add_index(database, Item, ['category', 'price', 'id'])
+    add_index(database, Item, ['price', 'id'])
+
+
+@migration
+def add_item_search_index(database):
+    if Item._meta.db_table in tables(database):
+        search.create_index(database)
+
+
+@migration
+def add_foreign_key_indexes(database):
+    # SQLite appends the rowid to every index, so these also serve the
+    # lookups ordered by id, like the items of an order
+    add_index(database, OrderItem, ['order'])
+    add_index(database, OrderItem, ['item'])
+    add_index(database, Address, ['user'])
+    add_index(database, Order, ['user'])
+    add_index(database, Picture, ['item'])
+
+
+@migration
+def add_idempotency_keys(database):
+    # Next to the orders, in each shard
+    if Order._meta.db_table not in tables(database):
+        return
+    database.execute_sql(
+        'CREATE TABLE IF NOT EXISTS "{}" ("id" INTEGER NOT NULL PRIMARY KEY, '
+        '"key" VARCHAR(255) NOT NULL, "fingerprint" VARCHAR(255) NOT NULL, '
+        '"response" TEXT NOT NULL, "expires_at" DATETIME NOT NULL)'.format(
+            IdempotencyKey._meta.db_table))
+    add_index(database, IdempotencyKey, ['key'], unique=True)
+    add_index(database, IdempotencyKey, ['expires_at'])
+
+
+def applied(database):
+    database.execute_sql(
+        'CREATE TABLE IF NOT EXISTS "{}" ("version" INTEGER NOT NULL PRIMARY KEY, '
+        '"name" VARCHAR(255) NOT NULL, "applied_at" DATETIME NOT NULL)'.format(
+            MIGRATIONS_TABLE))
+    cursor = database.execute_sql('SELECT "version" FROM "{}"'.format(MIGRATIONS_TABLE))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(database, target=None):
+    """
+    Apply the migrations not applied yet, up to the `target` version, each
+    one in its own transaction. Return the names of those applied.
+    """
+    done = applied(database)
+    names = []
+    for version, function in enumerate(MIGRATIONS, 1):
+        if target is not None and version > target:
+            break
+        if version in done:
+            continue
+
+        with database.atomic():
+            function(database)
+            database.execute_sql(
+                'INSERT INTO "{}" ("version", "name", "applied_at") VALUES (?, ?, ?)'.format(
+                    MIGRATIONS_TABLE),
+                (version, function.__name__, datetime.datetime.utcnow()))
+        names.append(function.__name__)
+
+    return names
+
+
+def convert_uuids(database, binary, models=UUID_MODELS, batch_size=CONVERSION_BATCH_SIZE):
+    """
+    Convert the uuid columns of an existing database to the 'binary' or
+    'text' storage, a batch of rows per transaction, and return the number
+    of rows converted. The rows already stored the new way are skipped, so
+    an interrupted conversion can be run again. SQLite stores any value in
+    any column, so the tables are left as they are, and the tables the
+    database does not have are skipped.
+    """
+    text_field = UUIDField()
+    source_type = 'text' if binary else 'blob'
+    present = tables(database)
+    converted = 0
+    for model in models:
+        table = model._meta.db_table
+        if table not in present:
+            continue
+        while True:
+            rows = database.execute_sql(
+                'SELECT "id", "uuid" FROM "{}" WHERE typeof("uuid") = ? LIMIT ?'.format(table),
+                (source_type, batch_size)).fetchall()
+            if not rows:
+                break
+
+            with database.atomic():
+                for row_id, value in rows:
+                    if binary:
+                        value = uuid.UUID(value).bytes
+                    else:
+                        value = text_field.db_value(uuid.UUID(bytes=bytes(value)))
+                    database.execute_sql(
+                        'UPDATE "{}" SET "uuid" = ? WHERE "id" = ?'.format(table),
+                        (value, row_id))
+            converted += len(rows)
+
+    return converted
+
+
+# The lookups made by the resources, checked by scan_report
+ACCESS_PATTERNS = [
+    ('item by uuid', lambda: Item.select().where(Item.uuid == uuid.uuid4())),
+    ('items by category', lambda: (Item.select()
+                                   .where(Item.category == '')
+                                   .order_by(Item.price, Item.id))),
+    ('items by price', lambda: (Item.select()
+                                .where(Item.price >= 0)
+                                .order_by(Item.price, Item.id))),
+    ('item facets', lambda: (Item.select(Item.category, fn.COUNT(Item.id))
+                             .group_by(Item.category))),
+    ('user by uuid', lambda: User.select().where(User.uuid == uuid.uuid4())),
+    ('user by email', lambda: User.select().where(User.email == '')),
+    ('address by uuid', lambda: Address.select().where(Address.uuid == uuid.uuid4())),
+    ('addresses of a user', lambda: Address.select().where(Address.user == 0)),
+    ('order by uuid', lambda: Order.select().where(Order.uuid == uuid.uuid4())),
+    ('orders of a user', lambda: Order.select().where(Order.user == 0).order_by(Order.id)),
+    ('items of an order', lambda: (OrderItem.select()
+                                   .where(OrderItem.order == 0)
+                                   .order_by(OrderItem.id))),
+    ('orders of an item', lambda: OrderItem.select().where(OrderItem.item == 0)),
+    ('idempotency key', lambda: IdempotencyKey.select().where(IdempotencyKey.key == '')),
+    ('expired idempotency keys', lambda: IdempotencyKey.select().where(
+        IdempotencyKey.expires_at < datetime.datetime.utcnow())),
+    ('pictures of an item', lambda: Picture.select().where(Picture.item == 0)),
+    ('table version', lambda: TableVersion.select().where(TableVersion.name == '')),
+]
+
+
+def scan_report(database, patterns=ACCESS_PATTERNS):
+    """
+    Return the (name, plan step) of the access patterns whose query plan
+    reads a whole table instead of going through an index, or the error of
+    those that cannot run on a database that is not migrated. The patterns
+    on tables the database does not have are skipped.
+    """
+    present = tables(database)
+    scans = []
+    for name, query in patterns:
+        query = query()
+        if query.model_class._meta.db_table not in present:
+            continue
+        sql, params = query.sql()
+        try:
+            cursor = database.execute_sql('EXPLAIN QUERY PLAN ' + sql, params)
+        except OperationalError as exc:
+            scans.append((name, str(exc)))
+            continue
+        for row in cursor.fetchall():
+            detail = row[-1]
+            if detail.startswith('SCAN') and 'INDEX' not in detail:
+                scans.append((name, detail))
+    return scans
@@ -1,51 +1,204 @@
-from peewee import Model, SqliteDatabase
+from collections import defaultdict
+import json
+import os
+import uuid
+from peewee import Model, Field, IntegrityError
 from peewee import DecimalField, TextField, CharField
-from peewee import UUIDField, ForeignKeyField, IntegerField
-from passlib.hash import pbkdf2_sha256
+from peewee import UUIDField, ForeignKeyField, IntegerField, DateTimeField
+import hashing
+import pool
+import shards
+import utils
 
-database = SqliteDatabase('database.db')
+STORAGE_PROFILE = os.environ.get('ECOMMERCE_STORAGE_PROFILE', 'default')
+
+MAX_CONNECTIONS = int(os.environ.get('ECOMMERCE_DB_MAX_CONNECTIONS', pool.MAX_CONNECTIONS))
+
+# Connections are borrowed from the pool for each request and returned to it
+database = pool.SqlitePool(
+    'database.db',
+    max_connections=MAX_CONNECTIONS,
+    pragmas=pool.PROFILES[STORAGE_PROFILE],
+)
+
+# Orders and their items are spread by user over this many database files,
+# with their own pools. With a single shard they stay in database.db.
+ORDER_SHARDS = int(os.environ.get('ECOMMERCE_ORDER_SHARDS', 1))
+orders_database = shards.ShardRouter([database] if ORDER_SHARDS == 1 else [
+    pool.SqlitePool('orders-{}.db'.format(shard),
+                    max_connections=MAX_CONNECTIONS,
+                    pragmas=pool.PROFILES[STORAGE_PROFILE])
+    for shard in range(ORDER_SHARDS)
+])
+
+# Every database file, the main one first
+DATABASES = [database] + [shard for shard in orders_database.databases if shard is not database]
+
+# How the uuid columns are stored, as 'text' or as 16 bytes 'binary' blobs.
+# An existing database is converted with scripts/convert-uuids.py.
+UUID_STORAGE = os.environ.get('ECOMMERCE_UUID_STORAGE', 'text')
+
+
+class BinaryUUIDField(Field):
+    """UUID stored as a 16 bytes blob, a third of its text size."""
+    db_field = 'blob'
+
+    def db_value(self, value):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            try:
+                value = uuid.UUID(str(value))
+            except ValueError:
+                # Like UUIDField, so that a malformed uuid matches no row
+                return value
+        return value.bytes
+
+    def python_value(self, value):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        if isinstance(value, str):
+            # A row not converted yet
+            return uuid.UUID(value)
+        return uuid.UUID(bytes=bytes(value))
+
+
+UUID_FIELDS = {
+    'text': UUIDField,
+    'binary': BinaryUUIDField,
+}
+UUID_FIELD = UUID_FIELDS[UUID_STORAGE]
 
 
 class BaseModel(Model):
+    # Fields of the object returned by json()
+    json_fields = ()
+    # Columns each field of json() is read from, when they are not just the
+    # column with the same name
+    json_columns = {}
+
     class Meta:
         database = database
 
+    @classmethod
+    def sparse_columns(cls, fields=None):
+        """Columns to select for json(fields), all of them when fields is None."""
+        if fields is None:
+            return [cls]
+
+        # Always select the keys the rows are looked up, paginated and
+        # tagged by
+        names = {cls._meta.primary_key.name}
+        names.update(name for name in ('uuid', 'version') if name in cls._meta.fields)
+        for field in fields:
+            names.update(cls.json_columns.get(field, (field,)))
+        return [cls._meta.fields[name] for name in sorted(names)]
+
+    @classmethod
+    def select_json(cls, fields=None):
+        return cls.select(*cls.sparse_columns(fields))
+
+
+class TableVersion(BaseModel):
+    # Counter bumped by every write to the table `name`
+    name = CharField(unique=True)
+    version = IntegerField(default=0)
+
+    @classmethod
+    def bump(cls, name, database=None):
+        """
+        Bump the version of the table `name`, kept in the `database` of the
+        table: the versions of the sharded tables are in their shards.
+        """
+        query = cls._on(cls.update(version=cls.version + 1).where(cls.name == name), database)
+        if not query.execute():
+            try:
+                with (database or cls._meta.database).atomic():
+                    cls._on(cls.insert(name=name, version=1), database).execute()
+            except IntegrityError:
+                cls.bump(name, database)
+
+    @classmethod
+    def current(cls, name, database=None):
+        rows = list(cls._on(cls.select(cls.version).where(cls.name == name), database))
+        return rows[0].version if rows else 0
 
-class Item(BaseModel):
-    uuid = UUIDField(unique=True)
+    @staticmethod
+    def _on(query, database):
+        # Queries run on their database attribute, the model's by default
+        if database is not None:
+            query.database = database
+        return query
+
+
+class VersionedModel(BaseModel):
+    # Incremented on every save, along with the version of the table, so
+    # that ETags can be computed without serializing the rows
+    version = IntegerField(default=1)
+
+    def save(self, *args, **kwargs):
+        with self._meta.database.atomic():
+            if self.get_id() is not None:
+                self.version += 1
+            result = super().save(*args, **kwargs)
+            TableVersion.bump(self._meta.db_table, self._meta.database)
+        return result
+
+    def delete_instance(self, *args, **kwargs):
+        with self._meta.database.atomic():
+            result = super().delete_instance(*args, **kwargs)
+            TableVersion.bump(self._meta.db_table, self._meta.database)
+        return result
+
+
+class Item(VersionedModel):
+    uuid = UUID_FIELD(unique=True)
     name = CharField()
     price = DecimalField()
     description = TextField()
     category = CharField()
 
-    def json(self):
-        return {
-            'uuid': str(self.uuid),
-            'name': self.name,
-            'price': int(self.price),
-            'description': self.description,
-            'category': self.category
-        }
+    class Meta:
+        indexes = (
+            # Category listings, filtered and sorted by price
+            (('category', 'price', 'id'), False),
+            # Price ranges and sorting across categories
+            (('price', 'id'), False),
+        )
+
+    json_fields = ('uuid', 'name', 'price', 'description', 'category')
+
+    def json(self, fields=None):
+        return utils.fieldset(fields, {
+            'uuid': lambda: str(self.uuid),
+            'name': lambda: self.name,
+            'price': lambda: int(self.price),
+            'description': lambda: self.description,
+            'category': lambda: self.category
+        })
 
 
 class User(BaseModel):
-    uuid = UUIDField(unique=True)
+    uuid = UUID_FIELD(unique=True)
     first_name = CharField()
     last_name = CharField()
     email = CharField(unique=True)
     password = CharField()
 
-    def json(self):
-        return {
-            'user_id': str(self.uuid)
-        }
+    json_fields = ('user_id',)
+    json_columns = {'user_id': ('uuid',)}
+
+    def json(self, fields=None):
+        return utils.fieldset(fields, {
+            'user_id': lambda: str(self.uuid)
+        })
 
     def verify_password(self, origin_password):
-        return pbkdf2_sha256.verify(origin_password, self.password)
+        return hashing.verify_password(origin_password, self.password)
 
 
-class Address(BaseModel):
-    uuid = UUIDField(unique=True)
+class Address(VersionedModel):
+    uuid = UUID_FIELD(unique=True)
     user = ForeignKeyField(User, related_name="address")
     nation = CharField()
     city = CharField()
@@ -53,43 +206,83 @@ class Address(BaseModel):
     local_address = CharField()
     phone = CharField()
 
-    def json(self):
-        return {
-            'uuid': str(self.uuid),
-            'user': str(self.user.uuid),
-            'nation': self.nation,
-            'city': self.city,
-            'postal_code': self.postal_code,
-            'local_address': self.local_address,
-            'phone': self.phone
-        }
+    json_fields = ('uuid', 'user', 'nation', 'city', 'postal_code', 'local_address', 'phone')
+
+    def json(self, fields=None):
+        return utils.fieldset(fields, {
+            'uuid': lambda: str(self.uuid),
+            'user': lambda: str(self.user.uuid),
+            'nation': lambda: self.nation,
+            'city': lambda: self.city,
+            'postal_code': lambda: self.postal_code,
+            'local_address': lambda: self.local_address,
+            'phone': lambda: self.phone
+        })
 
 
-class Order(BaseModel):
-    uuid = UUIDField(unique=True)
+class Order(VersionedModel):
+    uuid = UUID_FIELD(unique=True)
     total_price = DecimalField()
     user = ForeignKeyField(User, related_name="orders")
+    # Serialized order taken when it is written, so reads need no joins
+    snapshot = TextField(null=True)
 
-    def json(self):
-        return {
-            'uuid': str(self.uuid),
-            'total_price': float(self.total_price),
-            'user': str(self.user.uuid),
-            'items': self._get_order_items()
-        }
+    class Meta:
+        database = orders_database
 
-    def _get_order_items(self):
-        data = []
-        for order_item in self.order_items:
-            item = order_item.item
-            data.append({
-                'uuid': str(item.uuid),
-                'name': item.name,
-                'quantity': order_item.quantity,
-                'subtotal': float(order_item.subtotal)
-            })
+    json_fields = ('uuid', 'total_price', 'user', 'items')
+    # The user and the items are read from the snapshot when there is one
+    json_columns = {
+        'user': ('user', 'snapshot'),
+        'items': ('snapshot',),
+    }
+
+    def json(self, fields=None):
+        if self.snapshot is not None:
+            return utils.pick(json.loads(self.snapshot), fields)
+        return self._json(lambda: self.user, self._get_order_items, fields)
+
+    def take_snapshot(self, user, items):
+        data = self._json(lambda: user, lambda: items)
+        self.snapshot = json.dumps(data)
         return data
 
+    @classmethod
+    def json_list(cls, query, fields=None):
+        # The orders may be in a shard while the users and the items are in
+        # the main database, so instead of joins they are fetched by id, in
+        # batches that fit SQLite's bound-variable limit, and only when
+        # their fields are requested and the orders have no snapshot.
+        orders = list(query.select(*cls.sparse_columns(fields)))
+        pending = [order for order in orders if order.snapshot is None]
+
+        users = {}
+        if fields is None or 'user' in fields:
+            user_ids = {order.user_id for order in pending}
+            for batch in utils.chunked(list(user_ids), utils.IN_BATCH_SIZE):
+                users.update((user.id, user) for user in
+                             User.select(User.id, User.uuid).where(User.id << batch))
+
+        order_items = {}
+        if fields is None or 'items' in fields:
+            order_items = OrderItem.json_by_order([order.id for order in pending])
+
+        return [order.json(fields) if order.snapshot is not None
+                else order._json(lambda: users[order.user_id],
+                                 lambda: order_items.get(order.id, []), fields)
+                for order in orders]
+
+    def _json(self, user, items, fields=None):
+        return utils.fieldset(fields, {
+            'uuid': lambda: str(self.uuid),
+            'total_price': lambda: float(self.total_price),
+            'user': lambda: str(user().uuid),
+            'items': items
+        })
+
+    def _get_order_items(self):
+        return OrderItem.json_by_order([self.id]).get(self.id, [])
+
 
 class OrderItem(BaseModel):
     order = ForeignKeyField(Order, related_name="order_items")
@@ -97,16 +290,66 @@ class OrderItem(BaseModel):
     quantity = IntegerField()
     subtotal = DecimalField()
 
+    class Meta:
+        database = orders_database
 
-class Picture(BaseModel):
-    uuid = UUIDField(unique=True)
-    title = CharField()
-    exstension = CharField()
-    item = ForeignKeyField(Item, related_name="pictures")
+    @classmethod
+    def json_by_order(cls, order_ids):
+        """
+        The JSON of the items of the orders with `order_ids`, by order id.
+        The order items whose item was deleted are left out.
+        """
+        order_items = []
+        for batch in utils.chunked(order_ids, utils.IN_BATCH_SIZE):
+            order_items.extend(cls.select()
+                               .where(cls.order << batch)
+                               .order_by(cls.id))
+
+        items = {}
+        item_ids = {order_item.item_id for order_item in order_items}
+        for batch in utils.chunked(list(item_ids), utils.IN_BATCH_SIZE):
+            items.update((item.id, item) for item in Item.select().where(Item.id << batch))
+
+        result = defaultdict(list)
+        for order_item in order_items:
+            if order_item.item_id in items:
+                order_item.item = items[order_item.item_id]
+                result[order_item.order_id].append(order_item.json())
+        return result
 
     def json(self):
         return {
-            'uuid': str(self.uuid),
-            'title': self.name,
-            'extension': self.extension,
+            'uuid': str(self.item.uuid),
+            'name': self.item.name,
+            'quantity': self.quantity,
+            'subtotal': float(self.subtotal)
         }
+
+
+class IdempotencyKey(BaseModel):
+    # Response of an order created with an Idempotency-Key header, written
+    # in the shard and the transaction of the order, so that a retry is
+    # answered by any process
+    key = CharField(unique=True)
+    fingerprint = CharField()
+    response = TextField()
+    expires_at = DateTimeField(index=True)
+
+    class Meta:
+        database = orders_database
+
+
+class Picture(BaseModel):
+    uuid = UUID_FIELD(unique=True)
+    title = CharField()
+    extension = CharField(db_column='exstension')
+    item = ForeignKeyField(Item, related_name="pictures")
+
+    json_fields = ('uuid', 'title', 'extension')
+
+    def json(self, fields=None):
+        return utils.fieldset(fields, {
+            'uuid': lambda: str(self.uuid),
+            'title': lambda: self.title,
+            'extension': lambda: self.extension
+        })
@@ -0,0 +1,101 @@
+import base64
+import binascii
+import decimal
+import json
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value, default=str).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError('The cursor {} is not valid'.format(cursor))
+
+
+def page_limit(limit):
+    if limit is None:
+        return DEFAULT_LIMIT
+    if not 0 < limit <= MAX_LIMIT:
+        raise ValueError('The limit {} is out of range'.format(limit))
+    return limit
+
+
+def paginate(query, key, limit=None, cursor=None, descending=False):
+    """
+    Return the page of `query` that follows `cursor`, ordered by `key`,
+    together with the cursor of the next page (None on the last one).
+    `key` is an indexed field, or a tuple of fields ending with a unique one.
+    """
+    fields = key if isinstance(key, tuple) else (key,)
+    limit = page_limit(limit)
+
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError('The cursor {} is not valid'.format(cursor))
+        query = query.where(_after(fields, values, descending))
+    query = query.order_by(*[field.desc() if descending else field.asc() for field in fields])
+
+    # Peek one key past the page to know whether there is a next one
+    try:
+        keys = list(query.select(*fields).limit(limit + 1).tuples())
+    except (TypeError, decimal.InvalidOperation):
+        raise ValueError('The cursor {} is not valid'.format(cursor))
+
+    next_cursor = None
+    if len(keys) > limit:
+        next_cursor = encode_cursor(list(keys[limit - 1]))
+
+    return query.limit(limit), next_cursor
+
+
+def ranked_page(fetch, limit=None, cursor=None):
+    """
+    Like paginate, for results that are ranked rather than ordered by a key:
+    `fetch(limit, offset)` returns the rows and the cursor holds an offset.
+    """
+    limit = page_limit(limit)
+    offset = 0 if cursor is None else decode_cursor(cursor)
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError('The cursor {} is not valid'.format(cursor))
+
+    rows = fetch(limit + 1, offset)
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(offset + limit)
+
+    return rows[:limit], next_cursor
+
+
+def pages(query, key, limit=MAX_LIMIT, descending=False):
+    """Iterate over every page of `query`, fetched one at a time."""
+    cursor = None
+    while True:
+        page, cursor = paginate(query, key, limit, cursor, descending)
+        yield page
+        if cursor is None:
+            break
+
+
+def headers(next_cursor):
+    if next_cursor is None:
+        return {}
+    return {NEXT_CURSOR_HEADER: next_cursor}
+
+
+def _after(fields, values, descending):
+    # Rows whose key sorts after `values`: for a key (a, b) ascending,
+    # a > x OR (a = x AND b > y)
+    condition = None
+    for field, value in reversed(list(zip(fields, values))):
+        beyond = field < value if descending else field > value
+        condition = beyond if condition is None else beyond | ((field == value) & condition)
+    return condition
@@ -0,0 +1,214 @@
+import os
+import queue
+import tempfile
+import threading
+
+from PIL import Image
+
+# Directory the pictures and their thumbnails are stored in, named
+# <uuid>.<extension> and <uuid>_<size>.<extension>
+directory = os.environ.get('ECOMMERCE_PICTURES_DIR', 'pictures')
+
+CHUNK_SIZE = 64 * 1024
+MAX_SIZE = 10 * 1024 * 1024
+
+# Pillow format of the accepted pictures, with their extension, by mimetype
+FORMATS = {
+    'image/jpeg': ('JPEG', 'jpg'),
+    'image/png': ('PNG', 'png'),
+    'image/gif': ('GIF', 'gif'),
+    'image/webp': ('WEBP', 'webp'),
+}
+MIMETYPES = {extension: mimetype for mimetype, (_, extension) in FORMATS.items()}
+
+# Bounding box of the thumbnails, by size name
+THUMBNAIL_SIZES = {
+    'small': 128,
+    'medium': 512,
+}
+
+THUMBNAIL_WORKERS = 2
+
+
+class PictureTooLarge(ValueError):
+    pass
+
+
+class InvalidPicture(ValueError):
+    pass
+
+
+def path(uuid, extension, size=None):
+    name = str(uuid) if size is None else '{}_{}'.format(uuid, size)
+    return os.path.join(directory, '{}.{}'.format(name, extension))
+
+
+def mimetype(extension):
+    return MIMETYPES[extension]
+
+
+def save(stream, uuid, mimetype):
+    """
+    Copy the picture read from `stream` to its file, chunk by chunk, and
+    return its extension. The picture is written to a temporary file that
+    is only moved in place once it is complete and looks like an image of
+    the format its `mimetype` announces.
+    """
+    image_format, extension = FORMATS[mimetype]
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            written = 0
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                written += len(chunk)
+                if written > MAX_SIZE:
+                    raise PictureTooLarge(
+                        'The picture is larger than {} bytes'.format(MAX_SIZE))
+                tmp.write(chunk)
+
+        # Only the header is read here, decoding is left to the thumbnailer
+        try:
+            with Image.open(tmp_path) as image:
+                valid = image.format == image_format
+        except (IOError, SyntaxError):
+            valid = False
+        if not valid:
+            raise InvalidPicture('The picture is not a {} image'.format(image_format))
+
+        os.replace(tmp_path, path(uuid, extension))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return extension
+
+
+def delete(uuid, extension):
+    for size in [None] + list(THUMBNAIL_SIZES):
+        try:
+            os.remove(path(uuid, extension, size))
+        except FileNotFoundError:
+            pass
+
+
+def make_thumbnails(uuid, extension):
+    source = path(uuid, extension)
+    with Image.open(source) as image:
+        image_format = image.format
+        image.load()
+
+        for size, box in THUMBNAIL_SIZES.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail((box, box))
+
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as tmp:
+                    thumbnail.save(tmp, image_format)
+                os.replace(tmp_path, path(uuid, extension, size))
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+    # The picture may have been deleted while its thumbnails were made
+    if not os.path.exists(source):
+        delete(uuid, extension)
+
+
+class Thumbnailer:
+    """
+    Worker threads making the thumbnails of the uploaded pictures, so that
+    decoding and resizing images does not hold up the requests.
+    """
+
+    def __init__(self, workers=THUMBNAIL_WORKERS):
+        self.workers = workers
+        self.made = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name='thumbnailer-{}'.format(i), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, uuid, extension):
+        self._queue.put((uuid, extension))
+
+    def join(self):
+        """Wait for the submitted pictures to be processed."""
+        self._queue.join()
+
+    def stats(self):
+        return {
+            'made': self.made,
+            'failed': self.failed,
+            'queued': self._queue.qsize(),
+        }
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    break
+                try:
+                    make_thumbnails(*task)
+                except Exception:
+                    with self._lock:
+                        self.failed += 1
+                else:
+                    with self._lock:
+                        self.made += 1
+            finally:
+                self._queue.task_done()
+
+
+_thumbnailer = None
+
+
+def start(**kwargs):
+    global _thumbnailer
+    _thumbnailer = Thumbnailer(**kwargs)
+    _thumbnailer.start()
+
+
+def stop():
+    global _thumbnailer
+    if _thumbnailer is not None:
+        _thumbnailer.stop()
+        _thumbnailer = None
+
+
+def submit(uuid, extension):
+    """
+    Make the thumbnails of a picture, in the background when the
+    thumbnailer is running or right away otherwise. A picture that cannot
+    be decoded is left without thumbnails.
+    """
+    if _thumbnailer is None:
+        try:
+            make_thumbnails(uuid, extension)
+        except Exception:
+            # The picture is still served, without thumbnails
+            pass
+    else:
+        _thumbnailer.submit(uuid, extension)
+
+
+def join():
+    if _thumbnailer is not None:
+        _thumbnailer.join()
@@ -0,0 +1,122 @@
+import sqlite3
+import threading
+
+from playhouse.pool import PooledSqliteDatabase
+from werkzeug.exceptions import ServiceUnavailable
+
+MAX_CONNECTIONS = 16
+# Age in seconds after which a connection is closed rather than reused
+STALE_TIMEOUT = 300
+# Seconds a thread waits for a free connection
+WAIT_TIMEOUT = 5
+
+# Pragmas run on the new connections, by storage profile
+PROFILES = {
+    'default': (),
+    # Readers and the writer no longer block each other. The database can
+    # lose the last commits on power loss, but it is not corrupted.
+    'wal': (
+        ('journal_mode', 'wal'),
+        ('synchronous', 'normal'),
+        # 64 MiB of page cache per connection, and 256 MiB memory mapped
+        ('cache_size', -64 * 1024),
+        ('mmap_size', 256 * 1024 * 1024),
+    ),
+}
+
+
+class PoolExhausted(ServiceUnavailable):
+    description = 'No database connection is available, retry later.'
+
+
+class SqlitePool(PooledSqliteDatabase):
+    """
+    Pool of at most `max_connections` SQLite connections. connect() checks
+    out a connection for the calling thread, waiting up to `wait_timeout`
+    seconds for one to be returned when they are all in use, and close()
+    returns it to the pool. A pooled connection that fails a `SELECT 1` is
+    discarded instead of being handed out. The pragmas and other setup of
+    a connection only run when it is created. A connection checked out
+    with `read_only` rejects writes until it is returned.
+    """
+
+    def __init__(self, database, max_connections=MAX_CONNECTIONS,
+                 stale_timeout=STALE_TIMEOUT, wait_timeout=WAIT_TIMEOUT, **kwargs):
+        # The connections move between the threads borrowing them
+        kwargs.setdefault('check_same_thread', False)
+        super().__init__(database, max_connections=max_connections,
+                         stale_timeout=stale_timeout, **kwargs)
+        self.wait_timeout = wait_timeout
+        self.created = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._stats_lock = threading.Lock()
+        # Ids of the pooled connections with query_only set
+        self._query_only = set()
+
+    def connect(self, read_only=False):
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            with self._stats_lock:
+                self.timeouts += 1
+            raise PoolExhausted()
+        try:
+            super().connect()
+            self._set_query_only(read_only)
+        except BaseException:
+            if not self.is_closed():
+                super().close()
+            self._slots.release()
+            raise
+        with self._stats_lock:
+            self.checkouts += 1
+
+    def close(self):
+        if self.is_closed():
+            return
+        try:
+            super().close()
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        return {
+            'max_connections': self.max_connections,
+            'in_use': len(self._in_use),
+            'idle': len(self._connections),
+            'created': self.created,
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'discarded': self.discarded,
+        }
+
+    def _set_query_only(self, read_only):
+        # Only switched when the connection was last used the other way
+        conn = self.get_conn()
+        if read_only != (id(conn) in self._query_only):
+            conn.execute('PRAGMA query_only = {}'.format(int(read_only)))
+            if read_only:
+                self._query_only.add(id(conn))
+            else:
+                self._query_only.discard(id(conn))
+
+    def _add_conn_hooks(self, conn):
+        super()._add_conn_hooks(conn)
+        # The id of a closed connection may be reused by the new one
+        self._query_only.discard(id(conn))
+        with self._stats_lock:
+            self.created += 1
+
+    def _is_closed(self, key, conn):
+        closed = super()._is_closed(key, conn)
+        if not closed:
+            try:
+                conn.execute('SELECT 1').fetchone()
+            except sqlite3.Error:
+                closed = True
+        if closed:
+            self._query_only.discard(key)
+            with self._stats_lock:
+                self.discarded += 1
+        return closed
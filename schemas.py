@@ -0,0 +1,95 @@
+from flask import request
+from flask_restful import abort
+from http.client import BAD_REQUEST
+
+BODY = 'body'
+ARGS = 'args'
+
+
+class Field:
+    """
+    An argument of a request: `type` converts its value, raising TypeError
+    or ValueError when it is not valid. The value is read from the JSON or
+    form body, or from the query string when `location` is ARGS.
+    """
+
+    def __init__(self, type=str, required=False, default=None, choices=None,
+                 min_length=None, location=BODY):
+        self.type = type
+        self.required = required
+        self.default = default
+        self.choices = None if choices is None else frozenset(choices)
+        self.min_length = min_length
+        self.location = location
+
+    def convert(self, value):
+        value = self.type(value)
+        if self.choices is not None and value not in self.choices:
+            raise ValueError('{} is not a valid choice'.format(value))
+        if self.min_length is not None and len(value) < self.min_length:
+            raise ValueError('It must be at least {} characters long'.format(self.min_length))
+        return value
+
+
+class Schema:
+    """
+    The arguments of a request, declared once when the module is imported
+    and validated in a single pass over the body and the query string.
+    """
+
+    def __init__(self, **fields):
+        self.fields = fields
+        self._body = tuple((name, field) for name, field in fields.items()
+                           if field.location == BODY)
+        self._args = tuple((name, field) for name, field in fields.items()
+                           if field.location == ARGS)
+        self._body_names = frozenset(name for name, _ in self._body)
+        self._args_names = frozenset(name for name, _ in self._args)
+
+    def validate(self, body, args):
+        """
+        Return the converted arguments read from the `body` and `args`
+        mappings, and the errors by argument name. Undeclared arguments are
+        errors too.
+        """
+        values = {}
+        errors = {}
+        for source, fields, names in ((body, self._body, self._body_names),
+                                      (args, self._args, self._args_names)):
+            for name, field in fields:
+                value = source.get(name)
+                if value is None:
+                    if field.required:
+                        errors[name] = 'Missing required argument'
+                    values[name] = field.default
+                    continue
+                try:
+                    values[name] = field.convert(value)
+                except (TypeError, ValueError, AttributeError) as exc:
+                    errors[name] = str(exc) or 'Invalid value'
+
+            for name in source:
+                if name not in names:
+                    errors[name] = 'Unknown argument'
+
+        return values, errors
+
+    def parse(self):
+        """
+        Return the arguments of the current request, or abort it with 400
+        and the errors, by argument name, as message.
+        """
+        body = self._request_body() if self._body else {}
+        values, errors = self.validate(body, request.args)
+        if errors:
+            abort(BAD_REQUEST, message=errors)
+        return values
+
+    @staticmethod
+    def _request_body():
+        if not request.is_json:
+            return request.form
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(BAD_REQUEST, message='The body must be a JSON object')
+        return body
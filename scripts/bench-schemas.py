@@ -0,0 +1,48 @@
+"""
+Compare the time taken to parse the arguments of a request by building a
+reqparse.RequestParser, as the resources used to, with a precompiled
+Schema.
+"""
+import timeit
+
+from flask import Flask
+from flask_restful import reqparse
+
+from views.user import USER_SCHEMA
+import utils
+
+NUMBER = 10000
+
+FORM = {
+    'first_name': 'Anna',
+    'last_name': 'Markis',
+    'email': 'anna@markis.com',
+    'password': '1234567',
+}
+
+app = Flask(__name__)
+
+
+def request_parser():
+    parser = reqparse.RequestParser()
+    parser.add_argument('first_name', type=utils.non_empty_str, required=True)
+    parser.add_argument('last_name', type=utils.non_empty_str, required=True)
+    parser.add_argument('email', type=utils.non_empty_str, required=True)
+    parser.add_argument('password', type=utils.non_empty_str, required=True)
+    parser.add_argument('fields', type=utils.field_list(('user_id',)), location='args')
+    return parser.parse_args(strict=True)
+
+
+def schema():
+    return USER_SCHEMA.parse()
+
+
+def main():
+    with app.test_request_context('/users/', method='POST', data=FORM):
+        for name, parse in (('RequestParser', request_parser), ('Schema', schema)):
+            seconds = timeit.timeit(parse, number=NUMBER)
+            print('{:<15} {:8.1f} us/request'.format(name, seconds / NUMBER * 1e6))
+
+
+if __name__ == '__main__':
+    main()
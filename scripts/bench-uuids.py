@@ -0,0 +1,74 @@
+"""
+Compare the size of the uuid index and the latency of the lookups by uuid
+when the uuids are stored as text and as 16 bytes blobs, on a table of
+items with as many rows as given (2 million by default).
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+BATCH_SIZE = 10000
+LOOKUPS = 100000
+
+
+def create(path, rows, encode):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE item (id INTEGER NOT NULL PRIMARY KEY, '
+                 'uuid NOT NULL, name VARCHAR(255) NOT NULL)')
+    conn.execute('CREATE UNIQUE INDEX item_uuid ON item (uuid)')
+
+    random.seed(1)
+    sample = []
+    for start in range(0, rows, BATCH_SIZE):
+        batch = [uuid.UUID(int=random.getrandbits(128), version=4)
+                 for _ in range(min(BATCH_SIZE, rows - start))]
+        conn.executemany('INSERT INTO item (uuid, name) VALUES (?, ?)',
+                         ((encode(value), 'Item') for value in batch))
+        conn.commit()
+        sample.append(random.choice(batch))
+    return conn, sample
+
+
+def index_size(conn):
+    try:
+        return conn.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = 'item_uuid'").fetchone()[0]
+    except sqlite3.OperationalError:
+        # SQLite built without the dbstat table
+        return None
+
+
+def lookup_latency(conn, sample, encode):
+    keys = [encode(random.choice(sample)) for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    for key in keys:
+        conn.execute('SELECT id, name FROM item WHERE uuid = ?', (key,)).fetchone()
+    return (time.perf_counter() - start) / LOOKUPS
+
+
+def main(rows):
+    storages = [
+        ('text', str),
+        ('binary', lambda value: value.bytes),
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        for name, encode in storages:
+            path = os.path.join(directory, '{}.db'.format(name))
+            conn, sample = create(path, rows, encode)
+            size = index_size(conn)
+            latency = lookup_latency(conn, sample, encode)
+            conn.close()
+
+            print('{:<7} database {:7.1f} MiB, uuid index {} MiB, lookup {:5.1f} us'.format(
+                name,
+                os.path.getsize(path) / 2 ** 20,
+                'n/a' if size is None else '{:.1f}'.format(size / 2 ** 20),
+                latency * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000000)
@@ -0,0 +1,21 @@
+import sys
+
+from models import DATABASES
+import migrations
+
+
+def main(storage):
+    converted = 0
+    for database in DATABASES:
+        database.connect()
+        converted += migrations.convert_uuids(database, binary=storage == 'binary')
+        database.close()
+
+    print('Converted {} rows to {} uuids'.format(converted, storage))
+    print('Set ECOMMERCE_UUID_STORAGE={} before starting the API'.format(storage))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] not in ('binary', 'text'):
+        sys.exit('Usage: python scripts/convert-uuids.py binary|text')
+    main(sys.argv[1])
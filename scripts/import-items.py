@@ -0,0 +1,31 @@
+import sys
+
+from models import database
+import importer
+
+
+def main(path):
+    database.connect()
+
+    if path.endswith('.csv'):
+        reader = importer.read_csv
+    else:
+        reader = importer.read_ndjson
+
+    # Stream the file, a line at a time, through the importer
+    with open(path, newline='', encoding='utf-8', errors='replace') as lines:
+        report = importer.import_items(reader(lines))
+
+    database.close()
+
+    print('Created: {created}, updated: {updated}, failed: {failed}'.format(**report))
+    for error in report['errors']:
+        print('Row {row}: {error}'.format(**error))
+
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit('Usage: python scripts/import-items.py <items.csv|items.ndjson>')
+    sys.exit(main(sys.argv[1]))
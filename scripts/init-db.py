@@ -1,19 +1,38 @@
-from models import database, Item, User, Address, Order, OrderItem, Picture
+from models import database, orders_database, DATABASES
+from models import Item, User, Address, Order, OrderItem, Picture, TableVersion
+from models import IdempotencyKey
+import migrations
+import search
+
+
+def drop_versions(db):
+    db.execute_sql('DROP TABLE IF EXISTS "{}"'.format(TableVersion._meta.db_table))
+    db.execute_sql('DROP TABLE IF EXISTS "{}"'.format(migrations.MIGRATIONS_TABLE))
 
 
 def drop_tables():
     database.connect()
 
     # Initialize db by deleting all tables
+    search.drop_index(database)
     Item.drop_table(fail_silently=True)
     User.drop_table(fail_silently=True)
     Address.drop_table(fail_silently=True)
-    Order.drop_table(fail_silently=True)
-    OrderItem.drop_table(fail_silently=True)
     Picture.drop_table(fail_silently=True)
+    drop_versions(database)
 
     database.close()
 
+    # The orders are in their shards, database.db when there is only one
+    for shard in range(len(orders_database)):
+        with orders_database.using(shard) as db:
+            db.connect()
+            Order.drop_table(fail_silently=True)
+            OrderItem.drop_table(fail_silently=True)
+            IdempotencyKey.drop_table(fail_silently=True)
+            drop_versions(db)
+            db.close()
+
 
 def create_tables():
     database.connect()
@@ -22,12 +41,27 @@ def create_tables():
     Item.create_table()
     User.create_table()
     Address.create_table()
-    Order.create_table()
-    OrderItem.create_table()
     Picture.create_table()
+    TableVersion.create_table()
+    search.create_index(database)
 
     database.close()
 
+    for shard in range(len(orders_database)):
+        with orders_database.using(shard) as db:
+            db.connect()
+            Order.create_table()
+            OrderItem.create_table()
+            IdempotencyKey.create_table()
+            db.close()
+
+    # The new tables are up to date, record it. This also creates the
+    # table versions of the shards.
+    for db in DATABASES:
+        db.connect()
+        migrations.migrate(db)
+        db.close()
+
 
 def main():
     drop_tables()
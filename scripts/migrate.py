@@ -0,0 +1,33 @@
+import sys
+
+from models import DATABASES
+import migrations
+
+
+def main(args):
+    for database in DATABASES:
+        database.connect()
+        print('{}:'.format(database.database))
+
+        if args == ['--report']:
+            scans = migrations.scan_report(database)
+            for name, detail in scans:
+                print('{}: {}'.format(name, detail))
+            if not scans:
+                print('No lookup scans a whole table')
+        else:
+            target = int(args[0]) if args else None
+            applied = migrations.migrate(database, target)
+            for name in applied:
+                print('Applied {}'.format(name))
+            if not applied:
+                print('The database is up to date')
+
+        database.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 or sys.argv[1:] and not (
+            sys.argv[1] == '--report' or sys.argv[1].isdigit()):
+        sys.exit('Usage: python scripts/migrate.py [<version>|--report]')
+    main(sys.argv[1:])
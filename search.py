@@ -0,0 +1,72 @@
+import re
+
+from models import Item
+
+INDEX = 'item_search'
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def create_index(database=None):
+    """
+    Create the FTS5 index of the items, with the triggers keeping it in sync
+    with every insert, update and delete on the item table, and fill it
+    with the existing items.
+    """
+    database = database or Item._meta.database
+    table = Item._meta.db_table
+    statements = [
+        'CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5('
+        'name, description, category, tokenize="porter unicode61")',
+
+        'CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table} BEGIN '
+        'INSERT INTO {index}(rowid, name, description, category) '
+        'VALUES (new.id, new.name, new.description, new.category); END',
+
+        'CREATE TRIGGER IF NOT EXISTS {index}_update '
+        'AFTER UPDATE OF name, description, category ON {table} BEGIN '
+        'UPDATE {index} SET name = new.name, description = new.description, '
+        'category = new.category WHERE rowid = new.id; END',
+
+        'CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table} BEGIN '
+        'DELETE FROM {index} WHERE rowid = old.id; END',
+
+        'DELETE FROM {index}',
+
+        'INSERT INTO {index}(rowid, name, description, category) '
+        'SELECT id, name, description, category FROM {table}',
+    ]
+    with database.atomic():
+        for statement in statements:
+            database.execute_sql(statement.format(index=INDEX, table=table))
+
+
+def drop_index(database=None):
+    database = database or Item._meta.database
+    database.execute_sql('DROP TABLE IF EXISTS {}'.format(INDEX))
+
+
+def match_expression(text):
+    """
+    Turn free text into an FTS5 query matching the items containing every
+    word, or None if there is no word. Quoting the words keeps the FTS5
+    operators out of user input.
+    """
+    tokens = _TOKEN.findall(text)
+    if not tokens:
+        return None
+    return ' '.join('"{}"'.format(token) for token in tokens)
+
+
+def search(text, limit, offset=0):
+    """Return up to `limit` items matching `text`, the most relevant first."""
+    expression = match_expression(text)
+    if expression is None:
+        return []
+
+    query = (
+        'SELECT t1.* FROM {table} AS t1 '
+        'JOIN {index} ON {index}.rowid = t1.id '
+        'WHERE {index} MATCH ? ORDER BY {index}.rank LIMIT ? OFFSET ?'
+    ).format(table=Item._meta.db_table, index=INDEX)
+    return list(Item.raw(query, expression, limit, offset))
@@ -0,0 +1,122 @@
+from contextlib import contextmanager
+import threading
+import zlib
+
+import pagination
+
+
+class ShardRouter:
+    """
+    Stand-in database of the sharded models. It forwards every use to the
+    shard selected for the current thread by using(), the first one by
+    default, so that the queries of a request run on its shard while other
+    threads use theirs. The queries are executed within using(), or by the
+    scatter-gather methods, which run them on every shard in turn.
+    """
+
+    def __init__(self, databases):
+        self.databases = list(databases)
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+    def __len__(self):
+        return len(self.databases)
+
+    def current(self):
+        return self.databases[getattr(self._local, 'shard', 0)]
+
+    def shard_for(self, user_id):
+        """Shard of the rows of the user with `user_id`."""
+        if len(self.databases) == 1:
+            return 0
+        return zlib.crc32(str(user_id).encode()) % len(self.databases)
+
+    @contextmanager
+    def using(self, shard):
+        previous = getattr(self._local, 'shard', 0)
+        self._local.shard = shard
+        try:
+            yield self.databases[shard]
+        finally:
+            self._local.shard = previous
+
+    def close_shards(self):
+        """Return the connections the current thread opened on the shards."""
+        for database in self.databases:
+            if not database.is_closed():
+                database.close()
+
+    def find(self, fetch, missing):
+        """
+        Return the shard and the result of `fetch()` in the first shard where
+        it does not raise the `missing` exception, or raise it.
+        """
+        for shard in range(len(self.databases)):
+            with self.using(shard):
+                try:
+                    return shard, fetch()
+                except missing:
+                    continue
+        raise missing()
+
+    def gather(self, fetch):
+        """Concatenate the lists returned by `fetch()` on every shard."""
+        rows = []
+        for shard in range(len(self.databases)):
+            with self.using(shard):
+                rows.extend(fetch())
+        return rows
+
+    def pages(self, query, key, serialize):
+        """
+        Iterate over the rows of `query` on every shard in turn, fetched a
+        page at a time and serialized by `serialize(page)`.
+        """
+        for shard in range(len(self.databases)):
+            cursor = None
+            while True:
+                with self.using(shard):
+                    page, cursor = pagination.paginate(
+                        query, key, pagination.MAX_LIMIT, cursor)
+                    rows = serialize(page)
+                yield from rows
+                if cursor is None:
+                    break
+
+    def paginate(self, query, key, serialize, limit=None, cursor=None):
+        """
+        Return the page of `query` over the shards, ordered by shard then by
+        `key`, serialized by `serialize(page)`, together with the cursor of
+        the next page (None on the last one). The cursor holds the shard and
+        the cursor of pagination.paginate within it.
+        """
+        limit = pagination.page_limit(limit)
+        first, shard_cursor = 0, None
+        if cursor is not None:
+            values = pagination.decode_cursor(cursor)
+            if (not isinstance(values, list) or len(values) != 2
+                    or not isinstance(values[0], int)
+                    or not 0 <= values[0] < len(self.databases)
+                    or not isinstance(values[1], (str, type(None)))):
+                raise ValueError('The cursor {} is not valid'.format(cursor))
+            first, shard_cursor = values
+
+        rows = []
+        for shard in range(first, len(self.databases)):
+            with self.using(shard):
+                if len(rows) == limit:
+                    # The page is full, the next one starts at the next
+                    # shard with rows
+                    if query.exists():
+                        return rows, pagination.encode_cursor([shard, None])
+                    continue
+                page, next_cursor = pagination.paginate(
+                    query, key, limit - len(rows), shard_cursor)
+                rows.extend(serialize(page))
+            if next_cursor is not None:
+                return rows, pagination.encode_cursor([shard, next_cursor])
+            shard_cursor = None
+
+        return rows, None
@@ -0,0 +1,33 @@
+import json
+from flask import Response, stream_with_context
+
+CHUNK_SIZE = 100
+
+
+def json_array(objects, chunk_size=CHUNK_SIZE):
+    """Encode `objects` as a JSON array, yielding it a few objects at a time."""
+    yield '['
+    chunk = []
+    separator = ''
+    for obj in objects:
+        chunk.append(json.dumps(obj))
+        if len(chunk) == chunk_size:
+            yield separator + ','.join(chunk)
+            separator = ','
+            chunk = []
+    if chunk:
+        yield separator + ','.join(chunk)
+    yield ']'
+
+
+def fragments_response(fragments, headers=None):
+    """Respond with the JSON array of the already encoded `fragments`."""
+    body = b'[' + b','.join(fragments) + b']'
+    return Response(body, mimetype='application/json', headers=headers)
+
+
+def json_response(objects):
+    # Keep the request context, and so the database connection, alive
+    # until the whole body has been sent
+    return Response(stream_with_context(json_array(objects)),
+                    mimetype='application/json')
@@ -2,7 +2,7 @@ from http.client import CREATED, NO_CONTENT, NOT_FOUND, BAD_REQUEST, OK
 import json
 import uuid
 from peewee import SqliteDatabase
-from models import User, Address
+from models import User, Address, TableVersion
 from app import app
 
 
@@ -12,8 +12,10 @@ class TestAddress:
         db = SqliteDatabase(':memory:')
         User._meta.database = db
         Address._meta.database = db
+        TableVersion._meta.database = db
         User.create_table()
         Address.create_table()
+        TableVersion.create_table()
         cls.app = app.test_client()
 
         User.create(
@@ -0,0 +1,60 @@
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    def setup_method(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=2, ttl=10, clock=self.clock)
+
+    def test_get_set(self):
+        assert self.cache.get('a') is None
+        self.cache.set('a', 1)
+        assert self.cache.get('a') == 1
+        assert self.cache.stats()['hits'] == 1
+        assert self.cache.stats()['misses'] == 1
+
+    def test_expired(self):
+        self.cache.set('a', 1)
+        self.clock.now = 10
+        assert self.cache.get('a') is None
+        assert len(self.cache) == 0
+
+    def test_evict_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+
+        assert self.cache.get('a') == 1
+        assert self.cache.get('b') is None
+        assert self.cache.get('c') == 3
+
+    def test_add(self):
+        assert self.cache.add('a', 1)
+        assert not self.cache.add('a', 2)
+        assert self.cache.get('a') == 1
+
+        self.clock.now = 10
+        assert self.cache.add('a', 3)
+        assert self.cache.get('a') == 3
+
+    def test_pop(self):
+        self.cache.set('a', 1)
+        assert self.cache.pop('a') == 1
+        assert self.cache.pop('a') is None
+        assert self.cache.get('a') is None
+
+    def test_discard_if(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        assert self.cache.discard_if(lambda value: value == 1) == 1
+        assert self.cache.get('a') is None
+        assert self.cache.get('b') == 2
@@ -0,0 +1,50 @@
+import json
+import pytest
+from http.client import OK
+
+from app import app
+import hashing
+from hashing import HashingBusy, HashingPool, _hash, _verify
+
+
+class TestHashingPool:
+    @classmethod
+    def setup_class(cls):
+        cls.pool = HashingPool(workers=1, max_pending=1, timeout=0.01)
+        cls.pool.start()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.pool.stop()
+
+    def test_run(self):
+        password_hash = self.pool.run(_hash, '1234567')
+        assert self.pool.run(_verify, '1234567', password_hash)
+        assert not self.pool.run(_verify, '1234568', password_hash)
+
+        stats = self.pool.stats()
+        assert stats['completed'] >= 3
+        assert stats['in_flight'] == 0
+        assert stats['waiting'] == 0
+
+    def test_run__busy(self):
+        # Take the only slot, as a pending job would
+        self.pool._slots.acquire()
+        try:
+            with pytest.raises(HashingBusy):
+                self.pool.run(_hash, '1234567')
+        finally:
+            self.pool._slots.release()
+
+        assert self.pool.stats()['rejected'] == 1
+        assert self.pool.run(_verify, '1234567', _hash('1234567'))
+
+    def test_stats_resource(self, monkeypatch):
+        client = app.test_client()
+        resp = client.get('/stats')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode())['hashing'] is None
+
+        monkeypatch.setattr(hashing, '_pool', self.pool)
+        resp = client.get('/stats')
+        assert json.loads(resp.data.decode())['hashing'] == self.pool.stats()
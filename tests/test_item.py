@@ -5,20 +5,28 @@ from http.client import NO_CONTENT
 from http.client import NOT_FOUND
 from http.client import OK
 from http.client import BAD_REQUEST
-from models import Item
+from http.client import NOT_MODIFIED
+from http.client import UNSUPPORTED_MEDIA_TYPE
+from models import Item, Picture, TableVersion
 from app import app
+import catalog
+import search
 import uuid
 
 
 class TestItems:
     @classmethod
     def setup_class(cls):
-        Item._meta.database = SqliteDatabase(':memory:')
-        Item.create_table()
+        database = SqliteDatabase(':memory:')
+        for table in [Item, Picture, TableVersion]:
+            table._meta.database = database
+            table.create_table()
+        search.create_index()
         cls.app = app.test_client()
 
     def setup_method(self):
         Item.delete().execute()
+        catalog.clear()
 
     def test_get_items__empty(self):
         resp = self.app.get('/items/')
@@ -46,6 +54,406 @@ class TestItems:
         assert resp.status_code == OK
         assert json.loads(resp.data.decode()) == [item1.json(), item2.json()]
 
+    def test_get_items__paginated(self):
+        items = [Item.create(
+            uuid=uuid.uuid4(),
+            name='Item {}'.format(i),
+            price=5,
+            description='Description {}'.format(i),
+            category='Category one'
+        ) for i in range(5)]
+
+        resp = self.app.get('/items/?limit=2')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [item.json() for item in items[:2]]
+        cursor = resp.headers['X-Next-Cursor']
+
+        resp = self.app.get('/items/?limit=2&cursor={}'.format(cursor))
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [item.json() for item in items[2:4]]
+        cursor = resp.headers['X-Next-Cursor']
+
+        resp = self.app.get('/items/?limit=2&cursor={}'.format(cursor))
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [items[4].json()]
+        assert 'X-Next-Cursor' not in resp.headers
+
+    def test_get_items__paginated_failure_invalid_args(self):
+        resp = self.app.get('/items/?limit=0')
+        assert resp.status_code == BAD_REQUEST
+
+        resp = self.app.get('/items/?limit=2&cursor=not-a-cursor')
+        assert resp.status_code == BAD_REQUEST
+
+    def test_get_items__stream(self):
+        items = [Item.create(
+            uuid=uuid.uuid4(),
+            name='Item {}'.format(i),
+            price=5,
+            description='Description {}'.format(i),
+            category='Category one'
+        ) for i in range(3)]
+
+        resp = self.app.get('/items/?stream=true')
+        assert resp.status_code == OK
+        assert resp.mimetype == 'application/json'
+        assert json.loads(resp.data.decode()) == [item.json() for item in items]
+
+    def test_get_items__stream_empty(self):
+        resp = self.app.get('/items/?stream=true')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == []
+
+    def test_get_item__cached(self):
+        item1 = Item.create(
+            uuid=uuid.uuid4(),
+            name='Item one',
+            price=5,
+            description='Description one',
+            category='Category one'
+        )
+
+        resp = self.app.get('/item/{}'.format(item1.uuid))
+        assert json.loads(resp.data.decode()) == item1.json()
+        hits = catalog.items.hits
+
+        resp = self.app.get('/item/{}'.format(item1.uuid))
+        assert json.loads(resp.data.decode()) == item1.json()
+        assert catalog.items.hits == hits + 1
+
+        resp = self.app.put('/item/{}'.format(item1.uuid), data={
+            'name': 'Item one updated',
+            'price': 10,
+            'description': 'Description one',
+            'category': 'Category one'
+        })
+        assert resp.status_code == OK
+
+        resp = self.app.get('/item/{}'.format(item1.uuid))
+        assert json.loads(resp.data.decode())['name'] == 'Item one updated'
+
+        resp = self.app.delete('/item/{}'.format(item1.uuid))
+        assert resp.status_code == NO_CONTENT
+
+        resp = self.app.get('/item/{}'.format(item1.uuid))
+        assert resp.status_code == NOT_FOUND
+
+    def test_get_items__cached_list_invalidated(self):
+        resp = self.app.get('/items/')
+        assert json.loads(resp.data.decode()) == []
+
+        resp = self.app.post('/items/', data={
+            'name': 'Item one',
+            'price': 15,
+            'description': 'Description one',
+            'category': 'Category one'
+        })
+        assert resp.status_code == CREATED
+        item_from_server = json.loads(resp.data.decode())
+
+        resp = self.app.get('/items/')
+        assert json.loads(resp.data.decode()) == [item_from_server]
+
+    def test_get_items__cached_list_stale_version(self):
+        item1 = Item.create(
+            uuid=uuid.uuid4(),
+            name='Item one',
+            price=5,
+            description='Description one',
+            category='Category one'
+        )
+        resp = self.app.get('/items/')
+        etag = resp.headers['ETag']
+        assert json.loads(resp.data.decode()) == [item1.json()]
+
+        # Written by another process: the table version is bumped but the
+        # cached list of this one is not cleared
+        item2_uuid = uuid.uuid4()
+        Item.insert(
+            uuid=item2_uuid,
+            name='Item two',
+            price=15,
+            description='Description two',
+            category='Category two'
+        ).execute()
+        TableVersion.bump(Item._meta.db_table)
+
+        resp = self.app.get('/items/', headers={'If-None-Match': etag})
+        assert resp.status_code == OK
+        assert resp.headers['ETag'] != etag
+        assert json.loads(resp.data.decode()) == [
+            item1.json(), Item.get(Item.uuid == item2_uuid).json()]
+
+    def test_get_item__not_modified(self):
+        item1 = Item.create(
+            uuid=uuid.uuid4(),
+            name='Item one',
+            price=5,
+            description='Description one',
+            category='Category one'
+        )
+
+        resp = self.app.get('/item/{}'.format(item1.uuid))
+        assert resp.status_code == OK
+        etag = resp.headers['ETag']
+
+        resp = self.app.get('/item/{}'.format(item1.uuid), headers={'If-None-Match': etag})
+        assert resp.status_code == NOT_MODIFIED
+        assert resp.data == b''
+
+        resp = self.app.put('/item/{}'.format(item1.uuid), data={
+            'name': 'Item one updated',
+            'price': 10,
+            'description': 'Description one',
+            'category': 'Category one'
+        })
+        assert resp.status_code == OK
+
+        resp = self.app.get('/item/{}'.format(item1.uuid), headers={'If-None-Match': etag})
+        assert resp.status_code == OK
+        assert resp.headers['ETag'] != etag
+
+    def test_get_item__cached_row_stale_version(self):
+        item1 = Item.create(
+            uuid=uuid.uuid4(),
+            name='Item one',
+            price=5,
+            description='Description one',
+            category='Category one'
+        )
+        resp = self.app.get('/item/{}'.format(item1.uuid))
+        etag = resp.headers['ETag']
+
+        # Written by another process, the cached row of this one is kept
+        Item.update(name='Item one updated', version=Item.version + 1).where(
+            Item.id == item1.id).execute()
+
+        resp = self.app.get('/item/{}'.format(item1.uuid), headers={'If-None-Match': etag})
+        assert resp.status_code == OK
+        assert resp.headers['ETag'] != etag
+        assert json.loads(resp.data.decode())['name'] == 'Item one updated'
+
+        Item.delete().where(Item.id == item1.id).execute()
+        resp = self.app.get('/item/{}'.format(item1.uuid))
+        assert resp.status_code == NOT_FOUND
+
+    def test_get_items__not_modified(self):
+        resp = self.app.get('/items/')
+        etag = resp.headers['ETag']
+
+        resp = self.app.get('/items/', headers={'If-None-Match': etag})
+        assert resp.status_code == NOT_MODIFIED
+
+        resp = self.app.post('/items/', data={
+            'name': 'Item one',
+            'price': 15,
+            'description': 'Description one',
+            'category': 'Category one'
+        })
+        assert resp.status_code == CREATED
+
+        resp = self.app.get('/items/', headers={'If-None-Match': etag})
+        assert resp.status_code == OK
+        assert len(json.loads(resp.data.decode())) == 1
+
+    def test_search_items(self):
+        shoes = Item.create(
+            uuid=uuid.uuid4(),
+            name='Red shoes',
+            price=50,
+            description='Shoes for running',
+            category='Sport'
+        )
+        shirt = Item.create(
+            uuid=uuid.uuid4(),
+            name='Blue shirt',
+            price=20,
+            description='Cotton shirt',
+            category='Clothes'
+        )
+
+        resp = self.app.get('/items/search?q=shoe')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [shoes.json()]
+
+        resp = self.app.get('/items/search?q=running%20shoes')
+        assert json.loads(resp.data.decode()) == [shoes.json()]
+
+        resp = self.app.put('/item/{}'.format(shirt.uuid), data={
+            'name': 'Blue running shirt',
+            'price': 20,
+            'description': 'Cotton shirt',
+            'category': 'Sport'
+        })
+        assert resp.status_code == OK
+
+        resp = self.app.get('/items/search?q=sport&limit=1')
+        assert resp.status_code == OK
+        assert len(json.loads(resp.data.decode())) == 1
+
+        resp = self.app.get('/items/search?q=sport&limit=1&cursor={}'.format(
+            resp.headers['X-Next-Cursor']))
+        assert len(json.loads(resp.data.decode())) == 1
+        assert 'X-Next-Cursor' not in resp.headers
+
+        resp = self.app.delete('/item/{}'.format(shoes.uuid))
+        assert resp.status_code == NO_CONTENT
+
+        resp = self.app.get('/items/search?q=shoes')
+        assert json.loads(resp.data.decode()) == []
+
+    def test_search_items__failure_empty_query(self):
+        resp = self.app.get('/items/search?q=%20')
+        assert resp.status_code == BAD_REQUEST
+
+    def test_get_items__filtered(self):
+        for name, price, category in [('One', 5, 'Shoes'), ('Two', 30, 'Shoes'),
+                                      ('Three', 10, 'Shoes'), ('Four', 20, 'Shirts')]:
+            Item.create(
+                uuid=uuid.uuid4(),
+                name=name,
+                price=price,
+                description='Description',
+                category=category
+            )
+
+        resp = self.app.get('/items/?category=Shoes&max_price=20&sort=-price')
+        assert resp.status_code == OK
+        assert [item['name'] for item in json.loads(resp.data.decode())] == ['Three', 'One']
+
+        resp = self.app.get('/items/?min_price=10&sort=price&limit=2')
+        assert [item['name'] for item in json.loads(resp.data.decode())] == ['Three', 'Four']
+
+        resp = self.app.get('/items/?min_price=10&sort=price&limit=2&cursor={}'.format(
+            resp.headers['X-Next-Cursor']))
+        assert [item['name'] for item in json.loads(resp.data.decode())] == ['Two']
+
+        resp = self.app.get('/items/?sort=name')
+        assert resp.status_code == BAD_REQUEST
+
+    def test_get_items_facets(self):
+        for price, category in [(5, 'Shoes'), (30, 'Shoes'), (20, 'Shirts')]:
+            Item.create(
+                uuid=uuid.uuid4(),
+                name='Item',
+                price=price,
+                description='Description',
+                category=category
+            )
+
+        resp = self.app.get('/items/facets')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == {'Shirts': 1, 'Shoes': 2}
+
+        resp = self.app.get('/items/facets?max_price=20')
+        assert json.loads(resp.data.decode()) == {'Shirts': 1, 'Shoes': 1}
+
+    def test_get_items__fragments_cached(self):
+        item1 = Item.create(
+            uuid=uuid.uuid4(),
+            name='Item one',
+            price=5,
+            description='Description one',
+            category='Category one'
+        )
+
+        resp = self.app.get('/items/')
+        assert json.loads(resp.data.decode()) == [item1.json()]
+        hits = catalog.fragments.hits
+
+        resp = self.app.get('/items/')
+        assert json.loads(resp.data.decode()) == [item1.json()]
+        assert catalog.fragments.hits == hits + 1
+
+        resp = self.app.put('/item/{}'.format(item1.uuid), data={
+            'name': 'Item one updated',
+            'price': 5,
+            'description': 'Description one',
+            'category': 'Category one'
+        })
+        assert resp.status_code == OK
+
+        resp = self.app.get('/items/')
+        assert json.loads(resp.data.decode())[0]['name'] == 'Item one updated'
+
+    def test_import_items__ndjson(self):
+        item1 = Item.create(
+            uuid=uuid.uuid4(),
+            name='Item one',
+            price=5,
+            description='Description one',
+            category='Category one'
+        )
+        lines = [
+            {'uuid': str(item1.uuid), 'name': 'Item one updated', 'price': 6,
+             'description': 'Description one', 'category': 'Category one'},
+            {'name': 'Item two', 'price': 10, 'description': 'Description two',
+             'category': 'Category two'},
+            {'name': '', 'price': 10, 'description': 'Description', 'category': 'Category'},
+            {'name': 'Item', 'price': 'free', 'description': 'Description',
+             'category': 'Category'},
+            {'name': 'Item', 'price': 10},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n{not json\n'
+
+        resp = self.app.post('/items/import', data=body, content_type='application/x-ndjson')
+        assert resp.status_code == OK
+
+        report = json.loads(resp.data.decode())
+        assert report['created'] == 1
+        assert report['updated'] == 1
+        assert report['failed'] == 4
+        assert [error['row'] for error in report['errors']] == [3, 4, 5, 6]
+
+        assert len(Item.select()) == 2
+        assert Item.get(Item.uuid == item1.uuid).name == 'Item one updated'
+        assert Item.get(Item.uuid == item1.uuid).version == 2
+
+        resp = self.app.get('/item/{}'.format(item1.uuid))
+        assert json.loads(resp.data.decode())['price'] == 6
+
+    def test_import_items__csv(self):
+        body = (
+            'name,price,description,category\n'
+            'Item one,5,Description one,Category one\n'
+            'Item two,15,"Description, two",Category two\n'
+        )
+
+        resp = self.app.post('/items/import', data=body, content_type='text/csv')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode())['created'] == 2
+
+        items = [item.json() for item in Item.select().order_by(Item.id)]
+        assert [item['description'] for item in items] == ['Description one', 'Description, two']
+        assert items[1]['price'] == 15
+
+    def test_import_items__failure_unsupported_type(self):
+        resp = self.app.post('/items/import', data='{}', content_type='application/json')
+        assert resp.status_code == UNSUPPORTED_MEDIA_TYPE
+
+    def test_get_items__fields(self):
+        item1 = Item.create(
+            uuid=uuid.uuid4(),
+            name='Item one',
+            price=5,
+            description='Description one',
+            category='Category one'
+        )
+
+        resp = self.app.get('/items/?fields=uuid,name,price')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [
+            {'uuid': str(item1.uuid), 'name': 'Item one', 'price': 5}]
+
+        resp = self.app.get('/items/?fields=name&limit=10')
+        assert json.loads(resp.data.decode()) == [{'name': 'Item one'}]
+
+        resp = self.app.get('/item/{}?fields=price'.format(item1.uuid))
+        assert json.loads(resp.data.decode()) == {'price': 5}
+
+        resp = self.app.get('/items/?fields=name,weight')
+        assert resp.status_code == BAD_REQUEST
+
     def test_create_item__success(self):
         new_item_data = {
             'name': 'Item one',
@@ -0,0 +1,78 @@
+import os
+import tempfile
+from peewee import SqliteDatabase
+
+import migrations
+
+# The tables of the first version of the models, without foreign key indexes
+INITIAL_SCHEMA = [
+    'CREATE TABLE "item" ("id" INTEGER NOT NULL PRIMARY KEY, "uuid" VARCHAR(40) NOT NULL, '
+    '"name" VARCHAR(255) NOT NULL, "price" DECIMAL(10, 5) NOT NULL, '
+    '"description" TEXT NOT NULL, "category" VARCHAR(255) NOT NULL)',
+    'CREATE TABLE "user" ("id" INTEGER NOT NULL PRIMARY KEY, "uuid" VARCHAR(40) NOT NULL, '
+    '"first_name" VARCHAR(255) NOT NULL, "last_name" VARCHAR(255) NOT NULL, '
+    '"email" VARCHAR(255) NOT NULL, "password" VARCHAR(255) NOT NULL)',
+    'CREATE TABLE "address" ("id" INTEGER NOT NULL PRIMARY KEY, "uuid" VARCHAR(40) NOT NULL, '
+    '"user_id" INTEGER NOT NULL, "nation" VARCHAR(255) NOT NULL, '
+    '"city" VARCHAR(255) NOT NULL, "postal_code" VARCHAR(255) NOT NULL, '
+    '"local_address" VARCHAR(255) NOT NULL, "phone" VARCHAR(255) NOT NULL)',
+    'CREATE TABLE "order" ("id" INTEGER NOT NULL PRIMARY KEY, "uuid" VARCHAR(40) NOT NULL, '
+    '"total_price" DECIMAL(10, 5) NOT NULL, "user_id" INTEGER NOT NULL)',
+    'CREATE TABLE "orderitem" ("id" INTEGER NOT NULL PRIMARY KEY, '
+    '"order_id" INTEGER NOT NULL, "item_id" INTEGER NOT NULL, '
+    '"quantity" INTEGER NOT NULL, "subtotal" DECIMAL(10, 5) NOT NULL)',
+    'CREATE TABLE "picture" ("id" INTEGER NOT NULL PRIMARY KEY, "uuid" VARCHAR(40) NOT NULL, '
+    '"title" VARCHAR(255) NOT NULL, "exstension" VARCHAR(255) NOT NULL, '
+    '"item_id" INTEGER NOT NULL)',
+] + [
+    'CREATE UNIQUE INDEX "{0}_{1}" ON "{0}" ("{1}")'.format(table, column)
+    for table, column in [('item', 'uuid'), ('user', 'uuid'), ('user', 'email'),
+                          ('address', 'uuid'), ('order', 'uuid'), ('picture', 'uuid')]
+]
+
+
+class TestMigrations:
+    def setup_method(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = SqliteDatabase(os.path.join(self.directory.name, 'test.db'))
+        for statement in INITIAL_SCHEMA:
+            self.database.execute_sql(statement)
+        self.database.execute_sql(
+            'INSERT INTO "item" VALUES (1, \'a\', \'Shirt\', 10, \'Cotton shirt\', \'Shirts\')')
+        self.database.execute_sql('INSERT INTO "order" VALUES (1, \'b\', 10, 1)')
+
+    def teardown_method(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def test_migrate(self):
+        applied = migrations.migrate(self.database)
+        assert applied == [migration.__name__ for migration in migrations.MIGRATIONS]
+        assert migrations.migrate(self.database) == []
+
+        assert {'version', 'snapshot'} <= migrations.columns(self.database, 'order')
+        rows = self.database.execute_sql('SELECT "total_price", "version", "snapshot" FROM "order"')
+        assert rows.fetchall() == [(10, 1, None)]
+        rows = self.database.execute_sql(
+            'SELECT rowid FROM item_search WHERE item_search MATCH \'cotton\'')
+        assert rows.fetchall() == [(1,)]
+
+    def test_scan_report(self):
+        # Every migration before the foreign key indexes
+        migrations.migrate(self.database, target=migrations.MIGRATIONS.index(
+            migrations.add_foreign_key_indexes))
+        scans = dict(migrations.scan_report(self.database))
+        assert 'items of an order' in scans
+        assert 'orders of a user' in scans
+
+        migrations.migrate(self.database)
+        scans = dict(migrations.scan_report(self.database))
+        assert 'items of an order' not in scans
+        assert 'orders of a user' not in scans
+        assert 'item by uuid' not in scans
+
+    def test_migrate__target(self):
+        assert migrations.migrate(self.database, target=2) == [
+            'add_table_versions', 'add_row_versions']
+        assert 'snapshot' not in migrations.columns(self.database, 'order')
+        assert len(migrations.migrate(self.database)) == len(migrations.MIGRATIONS) - 2
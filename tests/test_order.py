@@ -1,10 +1,15 @@
+import datetime
 import uuid
 import json
-from peewee import SqliteDatabase
+import pytest
+from peewee import SqliteDatabase, IntegrityError
 from http.client import OK, NOT_FOUND, NO_CONTENT, CREATED, BAD_REQUEST
+from http.client import UNPROCESSABLE_ENTITY, NOT_MODIFIED
 
 from app import app
-from models import Order, OrderItem, Item, User
+from models import Order, OrderItem, Item, User, TableVersion, IdempotencyKey, orders_database
+import catalog
+from views.order import create_order_once, order_lines
 
 
 class TestOrders:
@@ -12,7 +17,7 @@ class TestOrders:
     def setup_class(cls):
         database = SqliteDatabase(':memory:')
 
-        tables = [OrderItem, Order, Item, User]
+        tables = [OrderItem, Order, Item, User, TableVersion, IdempotencyKey]
         for table in tables:
             table._meta.database = database
             table.create_table()
@@ -39,12 +44,14 @@ class TestOrders:
             category='Category one',
         )
 
+        catalog.clear()
         app.config['TESTING'] = True
         cls.app = app.test_client()
 
     def setup_method(self):
         OrderItem.delete().execute()
         Order.delete().execute()
+        IdempotencyKey.delete().execute()
 
     def test_get_orders__empty(self):
         resp = self.app.get('/orders/')
@@ -80,6 +87,145 @@ class TestOrders:
         assert resp.status_code == OK
         assert json.loads(resp.data.decode()) == [order1.json(), order2.json()]
 
+    def test_get_orders__many_items(self):
+        orders = []
+        for total_price in (30, 20):
+            order = Order.create(
+                uuid=uuid.uuid4(),
+                total_price=total_price,
+                user=self.user1.id,
+            )
+            OrderItem.create(
+                order=order.id,
+                item=self.item1.id,
+                quantity=1,
+                subtotal=self.item1.price,
+            )
+            OrderItem.create(
+                order=order.id,
+                item=self.item2.id,
+                quantity=2,
+                subtotal=self.item2.price * 2,
+            )
+            orders.append(order)
+
+        resp = self.app.get('/orders/')
+        assert resp.status_code == OK
+
+        orders_from_server = json.loads(resp.data.decode())
+        assert orders_from_server == [order.json() for order in orders]
+        assert [len(order['items']) for order in orders_from_server] == [2, 2]
+
+    def test_get_orders__paginated(self):
+        orders = [Order.create(
+            uuid=uuid.uuid4(),
+            total_price=10,
+            user=self.user1.id,
+        ) for _ in range(3)]
+        for order in orders:
+            OrderItem.create(
+                order=order.id,
+                item=self.item1.id,
+                quantity=1,
+                subtotal=self.item1.price,
+            )
+
+        resp = self.app.get('/orders/?limit=2')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [order.json() for order in orders[:2]]
+
+        resp = self.app.get('/orders/?limit=2&cursor={}'.format(
+            resp.headers['X-Next-Cursor']))
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [orders[2].json()]
+        assert 'X-Next-Cursor' not in resp.headers
+
+    def test_get_orders__stream(self):
+        orders = [Order.create(
+            uuid=uuid.uuid4(),
+            total_price=10,
+            user=self.user1.id,
+        ) for _ in range(3)]
+        for order in orders:
+            OrderItem.create(
+                order=order.id,
+                item=self.item1.id,
+                quantity=1,
+                subtotal=self.item1.price,
+            )
+
+        resp = self.app.get('/orders/?stream=true')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [order.json() for order in orders]
+
+    def test_get_order__not_modified(self):
+        order1 = Order.create(
+            uuid=uuid.uuid4(),
+            total_price=10,
+            user=self.user1.id,
+        )
+
+        resp = self.app.get('/orders/{}'.format(order1.uuid))
+        assert resp.status_code == OK
+        etag = resp.headers['ETag']
+
+        resp = self.app.get('/orders/{}'.format(order1.uuid), headers={'If-None-Match': etag})
+        assert resp.status_code == NOT_MODIFIED
+
+        resp = self.app.put('/orders/{}'.format(order1.uuid), data={
+            'items': json.dumps([[self.item1.uuid, 1]])
+        })
+        assert resp.status_code == OK
+
+        resp = self.app.get('/orders/{}'.format(order1.uuid), headers={'If-None-Match': etag})
+        assert resp.status_code == OK
+
+    def test_get_orders__not_modified(self):
+        resp = self.app.get('/orders/')
+        etag = resp.headers['ETag']
+
+        resp = self.app.get('/orders/', headers={'If-None-Match': etag})
+        assert resp.status_code == NOT_MODIFIED
+
+        Order.create(
+            uuid=uuid.uuid4(),
+            total_price=10,
+            user=self.user1.id,
+        )
+
+        resp = self.app.get('/orders/', headers={'If-None-Match': etag})
+        assert resp.status_code == OK
+
+    def test_get_orders__fields(self):
+        order1 = Order.create(
+            uuid=uuid.uuid4(),
+            total_price=10,
+            user=self.user1.id,
+        )
+        OrderItem.create(
+            order=order1.id,
+            item=self.item1.id,
+            quantity=1,
+            subtotal=self.item1.price,
+        )
+
+        resp = self.app.get('/orders/?fields=uuid,total_price')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [
+            {'uuid': str(order1.uuid), 'total_price': 10}]
+
+        resp = self.app.get('/orders/?fields=user,items')
+        order_from_server, = json.loads(resp.data.decode())
+        assert order_from_server['user'] == str(self.user1.uuid)
+        assert len(order_from_server['items']) == 1
+
+        resp = self.app.get('/orders/{}?fields=total_price'.format(order1.uuid))
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == {'total_price': 10}
+
+        resp = self.app.get('/orders/?fields=')
+        assert resp.status_code == BAD_REQUEST
+
     def test_create_order__success(self):
         new_order_data = {
             'user': self.user1.uuid,
@@ -108,6 +254,114 @@ class TestOrders:
         order_total = (self.item1.price * 2) + self.item2.price
         assert order_from_server['total_price'] == order_total
 
+    def test_create_order__snapshot(self):
+        new_order_data = {
+            'user': self.user1.uuid,
+            'items': json.dumps([
+                [self.item1.uuid, 2], [self.item2.uuid, 1]
+            ])
+        }
+
+        resp = self.app.post('/orders/', data=new_order_data)
+        assert resp.status_code == CREATED
+
+        order = Order.get(Order.uuid == json.loads(resp.data.decode())['uuid'])
+        snapshot = json.loads(order.snapshot)
+
+        # Rebuilt from the rows, the order matches its snapshot
+        order.snapshot = None
+        assert order.json() == snapshot
+
+        resp = self.app.get('/orders/{}'.format(order.uuid))
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == snapshot
+
+    def test_create_order__idempotency_key(self):
+        new_order_data = {
+            'user': self.user1.uuid,
+            'items': json.dumps([
+                [self.item1.uuid, 2]
+            ])
+        }
+        headers = {'Idempotency-Key': str(uuid.uuid4())}
+
+        resp = self.app.post('/orders/', data=new_order_data, headers=headers)
+        assert resp.status_code == CREATED
+        assert 'Idempotent-Replayed' not in resp.headers
+        order_from_server = json.loads(resp.data.decode())
+
+        resp = self.app.post('/orders/', data=new_order_data, headers=headers)
+        assert resp.status_code == CREATED
+        assert resp.headers['Idempotent-Replayed'] == 'true'
+        assert json.loads(resp.data.decode()) == order_from_server
+        assert len(Order.select()) == 1
+
+    def test_create_order__failure_idempotency_key_reused(self):
+        headers = {'Idempotency-Key': str(uuid.uuid4())}
+
+        resp = self.app.post('/orders/', headers=headers, data={
+            'user': self.user1.uuid,
+            'items': json.dumps([[self.item1.uuid, 1]])
+        })
+        assert resp.status_code == CREATED
+
+        resp = self.app.post('/orders/', headers=headers, data={
+            'user': self.user1.uuid,
+            'items': json.dumps([[self.item2.uuid, 1]])
+        })
+        assert resp.status_code == UNPROCESSABLE_ENTITY
+        assert len(Order.select()) == 1
+
+    def test_create_order__idempotency_key_expired(self):
+        new_order_data = {
+            'user': self.user1.uuid,
+            'items': json.dumps([[self.item1.uuid, 1]])
+        }
+        headers = {'Idempotency-Key': str(uuid.uuid4())}
+
+        resp = self.app.post('/orders/', data=new_order_data, headers=headers)
+        assert resp.status_code == CREATED
+        IdempotencyKey.update(expires_at=datetime.datetime.utcnow()).execute()
+
+        resp = self.app.post('/orders/', data=new_order_data, headers=headers)
+        assert resp.status_code == CREATED
+        assert 'Idempotent-Replayed' not in resp.headers
+        assert len(Order.select()) == 2
+        assert IdempotencyKey.select().count() == 1
+
+    def test_create_order_once__key_committed_meanwhile(self, monkeypatch):
+        # The transaction is opened on the shard
+        monkeypatch.setattr(orders_database, 'databases', [Order._meta.database])
+        lines = order_lines([[self.item1.uuid, 1]])
+        create_order_once(self.user1, lines, 'key', 'fingerprint')
+
+        with pytest.raises(IntegrityError):
+            create_order_once(self.user1, lines, 'key', 'fingerprint')
+        assert len(Order.select()) == 1
+        assert len(OrderItem.select()) == 1
+
+    def test_create_order__price_changed_by_another_process(self):
+        item = Item.create(
+            uuid=str(uuid.uuid4()),
+            name='Item three',
+            price=10,
+            description='Item three description',
+            category='Category one',
+        )
+        new_order_data = {
+            'user': self.user1.uuid,
+            'items': json.dumps([[item.uuid, 2]])
+        }
+        resp = self.app.post('/orders/', data=new_order_data)
+        assert json.loads(resp.data.decode())['total_price'] == 20
+
+        # The cached row of this process is kept
+        Item.update(price=15, version=Item.version + 1).where(Item.id == item.id).execute()
+
+        resp = self.app.post('/orders/', data=new_order_data)
+        assert resp.status_code == CREATED
+        assert json.loads(resp.data.decode())['total_price'] == 30
+
     def test_create_order__failure_missing_field(self):
         new_order_data = {
             'user': self.user1.uuid
@@ -139,6 +393,30 @@ class TestOrders:
         assert resp.status_code == BAD_REQUEST
         assert len(Order.select()) == 0
 
+    def test_create_order__failure_repeated_items(self):
+        new_order_data = {
+            'user': self.user1.uuid,
+            'items': json.dumps([
+                [self.item1.uuid, 1], [self.item1.uuid, 2]
+            ])
+        }
+
+        resp = self.app.post('/orders/', data=new_order_data)
+        assert resp.status_code == BAD_REQUEST
+        assert len(Order.select()) == 0
+
+    def test_create_order__failure_malformed_items(self):
+        new_order_data = {
+            'user': self.user1.uuid,
+            'items': json.dumps([
+                [self.item1.uuid]
+            ])
+        }
+
+        resp = self.app.post('/orders/', data=new_order_data)
+        assert resp.status_code == BAD_REQUEST
+        assert len(Order.select()) == 0
+
     def test_create_order__failure_non_existing_user(self):
         new_order_data = {
             'user': str(uuid.uuid4()),
@@ -151,6 +429,42 @@ class TestOrders:
         assert resp.status_code == BAD_REQUEST
         assert len(Order.select()) == 0
 
+    def test_create_orders_batch(self):
+        new_orders_data = {
+            'orders': json.dumps([
+                {'user': self.user1.uuid, 'items': [[self.item1.uuid, 2]]},
+                {'user': str(uuid.uuid4()), 'items': [[self.item1.uuid, 1]]},
+                {'user': self.user1.uuid, 'items': [[str(uuid.uuid4()), 1]]},
+                {'user': self.user1.uuid},
+                {'user': self.user1.uuid, 'items': [
+                    [self.item1.uuid, 1], [self.item2.uuid, 3]
+                ]},
+            ])
+        }
+
+        version = TableVersion.current(Order._meta.db_table)
+        resp = self.app.post('/orders/batch', data=new_orders_data)
+        assert resp.status_code == OK
+
+        results = json.loads(resp.data.decode())
+        assert [result['status'] for result in results] == [
+            CREATED, BAD_REQUEST, BAD_REQUEST, BAD_REQUEST, CREATED]
+        assert len(Order.select()) == 2
+        # One transaction, one bump of the table version
+        assert TableVersion.current(Order._meta.db_table) == version + 1
+
+        for result in (results[0], results[4]):
+            order_from_db = Order.get(Order.uuid == result['order']['uuid']).json()
+            assert order_from_db == result['order']
+
+        assert results[0]['order']['total_price'] == self.item1.price * 2
+        assert len(results[4]['order']['items']) == 2
+
+    def test_create_orders_batch__failure_not_a_list(self):
+        resp = self.app.post('/orders/batch', data={'orders': json.dumps({})})
+        assert resp.status_code == BAD_REQUEST
+        assert len(Order.select()) == 0
+
     def test_modify_order__success(self):
         order1 = Order.create(
             uuid=uuid.uuid4(),
@@ -0,0 +1,140 @@
+import io
+import json
+import os
+import tempfile
+import uuid
+from http.client import CREATED, NO_CONTENT, NOT_FOUND, OK, PARTIAL_CONTENT
+from http.client import BAD_REQUEST, UNSUPPORTED_MEDIA_TYPE
+from PIL import Image
+from peewee import SqliteDatabase
+from models import Item, Picture, TableVersion
+from app import app
+import catalog
+import pictures
+
+
+def png(width, height):
+    data = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(data, 'PNG')
+    return data.getvalue()
+
+
+class TestPictures:
+    @classmethod
+    def setup_class(cls):
+        database = SqliteDatabase(':memory:')
+        for table in [Item, Picture, TableVersion]:
+            table._meta.database = database
+            table.create_table()
+        cls.directory = tempfile.TemporaryDirectory()
+        pictures.directory = cls.directory.name
+        cls.app = app.test_client()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.directory.cleanup()
+
+    def setup_method(self):
+        Picture.delete().execute()
+        Item.delete().execute()
+        catalog.clear()
+        self.item = Item.create(
+            uuid=uuid.uuid4(),
+            name='Item one',
+            price=5,
+            description='Description one',
+            category='Category one'
+        )
+
+    def upload(self, data, content_type='image/png', title='Front'):
+        return self.app.post('/item/{}/pictures?title={}'.format(self.item.uuid, title),
+                             data=data, content_type=content_type)
+
+    def test_upload(self):
+        data = png(800, 600)
+        resp = self.upload(data)
+        assert resp.status_code == CREATED
+
+        picture = Picture.get()
+        assert json.loads(resp.data.decode()) == {
+            'uuid': str(picture.uuid),
+            'title': 'Front',
+            'extension': 'png',
+        }
+        with open(pictures.path(picture.uuid, 'png'), 'rb') as f:
+            assert f.read() == data
+
+        resp = self.app.get('/item/{}/pictures'.format(self.item.uuid))
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [picture.json()]
+
+    def test_upload__invalid(self):
+        resp = self.upload(b'not an image')
+        assert resp.status_code == BAD_REQUEST
+
+        resp = self.upload(png(10, 10), content_type='image/jpeg')
+        assert resp.status_code == BAD_REQUEST
+
+        resp = self.upload(png(10, 10), content_type='application/pdf')
+        assert resp.status_code == UNSUPPORTED_MEDIA_TYPE
+
+        resp = self.app.post('/item/{}/pictures?title=Front'.format(uuid.uuid4()),
+                             data=png(10, 10), content_type='image/png')
+        assert resp.status_code == NOT_FOUND
+
+        assert Picture.select().count() == 0
+        assert os.listdir(pictures.directory) == []
+
+    def test_download(self):
+        data = png(800, 600)
+        picture_uuid = json.loads(self.upload(data).data.decode())['uuid']
+
+        resp = self.app.get('/pictures/{}'.format(picture_uuid))
+        assert resp.status_code == OK
+        assert resp.mimetype == 'image/png'
+        assert resp.data == data
+        assert resp.cache_control.max_age > 0
+
+        resp = self.app.get('/pictures/{}'.format(picture_uuid),
+                            headers={'If-None-Match': resp.headers['ETag']})
+        assert resp.status_code == 304
+
+        resp = self.app.get('/pictures/{}'.format(picture_uuid),
+                            headers={'Range': 'bytes=0-9'})
+        assert resp.status_code == PARTIAL_CONTENT
+        assert resp.data == data[:10]
+
+        resp = self.app.get('/pictures/{}'.format(uuid.uuid4()))
+        assert resp.status_code == NOT_FOUND
+
+    def test_thumbnails(self):
+        picture_uuid = json.loads(self.upload(png(800, 600)).data.decode())['uuid']
+        pictures.join()
+
+        for size, box in pictures.THUMBNAIL_SIZES.items():
+            resp = self.app.get('/pictures/{}?size={}'.format(picture_uuid, size))
+            assert resp.status_code == OK
+            image = Image.open(io.BytesIO(resp.data))
+            assert image.format == 'PNG'
+            assert max(image.size) == box
+
+    def test_delete(self):
+        picture_uuid = json.loads(self.upload(png(800, 600)).data.decode())['uuid']
+        pictures.join()
+
+        resp = self.app.delete('/pictures/{}'.format(picture_uuid))
+        assert resp.status_code == NO_CONTENT
+        assert Picture.select().count() == 0
+        assert os.listdir(pictures.directory) == []
+
+        resp = self.app.get('/pictures/{}'.format(picture_uuid))
+        assert resp.status_code == NOT_FOUND
+
+    def test_delete_item(self):
+        self.upload(png(800, 600))
+        pictures.join()
+
+        resp = self.app.delete('/item/{}'.format(self.item.uuid))
+        assert resp.status_code == NO_CONTENT
+        assert Picture.select().count() == 0
+        assert os.listdir(pictures.directory) == []
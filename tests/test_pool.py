@@ -0,0 +1,111 @@
+import os
+import tempfile
+import threading
+import json
+import pytest
+from http.client import OK
+from peewee import OperationalError
+
+from app import app
+from pool import SqlitePool, PoolExhausted, PROFILES
+
+
+class TestSqlitePool:
+    def setup_method(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = SqlitePool(
+            os.path.join(self.directory.name, 'test.db'), max_connections=2, wait_timeout=0.01)
+
+    def teardown_method(self):
+        self.database.close_all()
+        self.directory.cleanup()
+
+    def test_reuse(self):
+        for _ in range(10):
+            self.database.connect()
+            self.database.execute_sql('SELECT 1')
+            self.database.close()
+
+        stats = self.database.stats()
+        assert stats['created'] == 1
+        assert stats['checkouts'] == 10
+        assert stats['in_use'] == 0
+        assert stats['idle'] == 1
+
+    def test_exhausted(self):
+        ready = threading.Event()
+        done = threading.Event()
+
+        def hold():
+            self.database.connect()
+            ready.set()
+            done.wait()
+            self.database.close()
+
+        threads = [threading.Thread(target=hold) for _ in range(2)]
+        for thread in threads:
+            ready.clear()
+            thread.start()
+            ready.wait()
+
+        with pytest.raises(PoolExhausted):
+            self.database.connect()
+        assert self.database.stats()['timeouts'] == 1
+
+        done.set()
+        for thread in threads:
+            thread.join()
+
+        self.database.connect()
+        assert self.database.stats()['created'] == 2
+        self.database.close()
+
+    def test_health_check(self):
+        self.database.connect()
+        connection = self.database.get_conn()
+        self.database.close()
+        connection.close()
+
+        self.database.connect()
+        self.database.execute_sql('SELECT 1')
+        self.database.close()
+
+        stats = self.database.stats()
+        assert stats['discarded'] == 1
+        assert stats['created'] == 2
+
+    def test_read_only(self):
+        self.database.connect()
+        self.database.execute_sql('CREATE TABLE thing (id INTEGER PRIMARY KEY)')
+        self.database.close()
+
+        self.database.connect(read_only=True)
+        assert self.database.execute_sql('SELECT COUNT(*) FROM thing').fetchone() == (0,)
+        with pytest.raises(OperationalError):
+            self.database.execute_sql('INSERT INTO thing DEFAULT VALUES')
+        self.database.close()
+
+        # The same pooled connection, writable again
+        self.database.connect()
+        self.database.execute_sql('INSERT INTO thing DEFAULT VALUES')
+        self.database.close()
+        assert self.database.stats()['created'] == 1
+
+    def test_wal_profile(self):
+        database = SqlitePool(
+            os.path.join(self.directory.name, 'wal.db'), pragmas=PROFILES['wal'])
+        database.connect()
+        assert database.execute_sql('PRAGMA journal_mode').fetchone() == ('wal',)
+        assert database.execute_sql('PRAGMA synchronous').fetchone() == (1,)
+        database.close()
+        database.close_all()
+
+    def test_stats_resource(self):
+        resp = app.test_client().get('/stats')
+        assert resp.status_code == OK
+
+        # Taken while the request holds its connection
+        stats = json.loads(resp.data.decode())['database']
+        assert stats['in_use'] == 1
+        assert stats['checkouts'] >= 1
+        assert set(stats) == set(self.database.stats())
@@ -0,0 +1,66 @@
+import json
+from http.client import BAD_REQUEST, CREATED
+from peewee import SqliteDatabase
+from models import User
+from app import app
+from schemas import Schema, Field, ARGS
+import utils
+
+
+class TestSchema:
+    def setup_method(self):
+        self.schema = Schema(
+            name=Field(utils.non_empty_str, required=True),
+            price=Field(int, required=True),
+            code=Field(min_length=3),
+            sort=Field(choices=('id', 'price'), default='id', location=ARGS),
+        )
+
+    def test_validate(self):
+        values, errors = self.schema.validate({'name': 'Item', 'price': '5'}, {})
+        assert errors == {}
+        assert values == {'name': 'Item', 'price': 5, 'code': None, 'sort': 'id'}
+
+    def test_validate__errors(self):
+        values, errors = self.schema.validate(
+            {'name': ' ', 'code': 'ab', 'color': 'red'}, {'sort': 'name'})
+        assert set(errors) == {'name', 'price', 'code', 'color', 'sort'}
+        assert errors['price'] == 'Missing required argument'
+        assert errors['color'] == 'Unknown argument'
+
+
+class TestRequestSchemas:
+    @classmethod
+    def setup_class(cls):
+        User._meta.database = SqliteDatabase(':memory:')
+        User.create_table()
+        cls.app = app.test_client()
+
+    def setup_method(self):
+        User.delete().execute()
+
+    def test_json_body(self):
+        data = {
+            'first_name': 'Anna',
+            'last_name': 'Markis',
+            'email': 'anna@markis.com',
+            'password': '1234567'
+        }
+        resp = self.app.post('/users/', data=json.dumps(data), content_type='application/json')
+        assert resp.status_code == CREATED
+        assert User.get().email == 'anna@markis.com'
+
+    def test_structured_errors(self):
+        data = {
+            'first_name': 'Anna',
+            'email': 'anna',
+            'password': '123'
+        }
+        resp = self.app.post('/users/', data=json.dumps(data), content_type='application/json')
+        assert resp.status_code == BAD_REQUEST
+        errors = json.loads(resp.data.decode())['message']
+        assert set(errors) == {'last_name', 'email', 'password'}
+
+        resp = self.app.post('/users/', data='[]', content_type='application/json')
+        assert resp.status_code == BAD_REQUEST
+        assert User.select().count() == 0
@@ -0,0 +1,243 @@
+import json
+import os
+import tempfile
+import uuid
+from peewee import SqliteDatabase
+from http.client import OK, NOT_FOUND, NO_CONTENT, CREATED, NOT_MODIFIED
+from http.client import INTERNAL_SERVER_ERROR
+
+from app import app
+from models import Order, OrderItem, Item, User, TableVersion, IdempotencyKey, orders_database
+import catalog
+import migrations
+import writer
+
+SHARDS = 2
+
+
+class TestShards:
+    @classmethod
+    def setup_class(cls):
+        database = SqliteDatabase(':memory:')
+        for table in [Item, User, TableVersion]:
+            table._meta.database = database
+            table.create_table()
+
+        # The shards are files, the requests close their connections
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.databases = orders_database.databases
+        orders_database.databases = [
+            SqliteDatabase(os.path.join(cls.directory.name, 'orders-{}.db'.format(shard)))
+            for shard in range(SHARDS)]
+        for table in [Order, OrderItem, IdempotencyKey]:
+            table._meta.database = orders_database
+        for shard in range(SHARDS):
+            with orders_database.using(shard) as shard_database:
+                Order.create_table()
+                OrderItem.create_table()
+                IdempotencyKey.create_table()
+                migrations.add_table_versions(shard_database)
+
+        # A user on each shard
+        cls.users = {}
+        while len(cls.users) < SHARDS:
+            user = User.create(
+                uuid=str(uuid.uuid4()),
+                first_name='Name',
+                last_name='Surname',
+                email='email{}@domain.com'.format(len(cls.users)),
+                password='password',
+            )
+            cls.users.setdefault(orders_database.shard_for(user.id), user)
+
+        cls.item = Item.create(
+            uuid=str(uuid.uuid4()),
+            name='Item one',
+            price=10,
+            description='Item one description',
+            category='Category one',
+        )
+
+        catalog.clear()
+        app.config['TESTING'] = True
+        cls.app = app.test_client()
+
+    @classmethod
+    def teardown_class(cls):
+        orders_database.close_shards()
+        orders_database.databases = cls.databases
+        cls.directory.cleanup()
+
+    def setup_method(self):
+        for shard in range(SHARDS):
+            with orders_database.using(shard):
+                OrderItem.delete().execute()
+                Order.delete().execute()
+                IdempotencyKey.delete().execute()
+
+    def create_order(self, shard):
+        resp = self.app.post('/orders/', data={
+            'user': self.users[shard].uuid,
+            'items': json.dumps([[self.item.uuid, 2]]),
+        })
+        assert resp.status_code == CREATED
+        return json.loads(resp.data.decode())
+
+    def shard_orders(self, shard):
+        with orders_database.using(shard):
+            return [str(order.uuid) for order in Order.select().order_by(Order.id)]
+
+    def test_shard_for(self):
+        shards = [orders_database.shard_for(user_id) for user_id in range(1, 100)]
+        assert set(shards) == set(range(SHARDS))
+        assert shards == [orders_database.shard_for(user_id) for user_id in range(1, 100)]
+
+    def test_create_order(self):
+        orders = [self.create_order(shard) for shard in range(SHARDS)]
+
+        for shard, order in enumerate(orders):
+            assert self.shard_orders(shard) == [order['uuid']]
+            assert order['user'] == self.users[shard].uuid
+            assert order['items'][0]['quantity'] == 2
+
+    def test_create_order__idempotency_key(self):
+        headers = {'Idempotency-Key': str(uuid.uuid4())}
+        data = {'user': self.users[1].uuid, 'items': json.dumps([[self.item.uuid, 1]])}
+
+        resp = self.app.post('/orders/', data=data, headers=headers)
+        assert resp.status_code == CREATED
+        order = json.loads(resp.data.decode())
+
+        resp = self.app.post('/orders/', data=data, headers=headers)
+        assert resp.headers['Idempotent-Replayed'] == 'true'
+        assert json.loads(resp.data.decode()) == order
+        assert self.shard_orders(1) == [order['uuid']]
+        with orders_database.using(1):
+            assert IdempotencyKey.get().key == headers['Idempotency-Key']
+
+    def test_create_orders_batch(self):
+        resp = self.app.post('/orders/batch', data={'orders': json.dumps([
+            {'user': self.users[shard].uuid, 'items': [[self.item.uuid, 1]]}
+            for shard in (1, 0, 1)
+        ])})
+        assert resp.status_code == OK
+
+        results = json.loads(resp.data.decode())
+        assert [result['status'] for result in results] == [CREATED] * 3
+        assert [result['order']['user'] for result in results] == [
+            self.users[shard].uuid for shard in (1, 0, 1)]
+        assert self.shard_orders(0) == [results[1]['order']['uuid']]
+        assert self.shard_orders(1) == [results[0]['order']['uuid'],
+                                        results[2]['order']['uuid']]
+
+    def test_create_orders_batch__shard_failure(self, monkeypatch):
+        submit_to_shard = writer.submit_to_shard
+
+        def failing_shard(shard, fn, *args):
+            if shard == 1:
+                raise RuntimeError('shard unavailable')
+            return submit_to_shard(shard, fn, *args)
+        monkeypatch.setattr(writer, 'submit_to_shard', failing_shard)
+
+        resp = self.app.post('/orders/batch', data={'orders': json.dumps([
+            {'user': self.users[shard].uuid, 'items': [[self.item.uuid, 1]]}
+            for shard in (1, 0)
+        ])})
+        assert resp.status_code == OK
+
+        results = json.loads(resp.data.decode())
+        assert [result['status'] for result in results] == [INTERNAL_SERVER_ERROR, CREATED]
+        assert self.shard_orders(0) == [results[1]['order']['uuid']]
+        assert self.shard_orders(1) == []
+
+    def test_get_orders(self):
+        orders = [self.create_order(shard) for shard in (1, 0, 1, 0)]
+
+        resp = self.app.get('/orders/')
+        assert resp.status_code == OK
+        # One shard after the other
+        assert json.loads(resp.data.decode()) == [orders[1], orders[3], orders[0], orders[2]]
+
+    def test_get_orders__stream(self):
+        orders = [self.create_order(shard) for shard in (1, 0)]
+
+        resp = self.app.get('/orders/?stream=true')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == [orders[1], orders[0]]
+
+    def test_get_orders__paginated(self):
+        orders = [self.create_order(shard) for shard in (0, 0, 1, 1, 1)]
+
+        # The first page ends in the middle of the second shard
+        resp = self.app.get('/orders/?limit=3')
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == orders[:3]
+
+        resp = self.app.get('/orders/?limit=3&cursor={}'.format(
+            resp.headers['X-Next-Cursor']))
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == orders[3:]
+        assert 'X-Next-Cursor' not in resp.headers
+
+    def test_get_orders__paginated_shard_boundary(self):
+        orders = [self.create_order(shard) for shard in (0, 0, 1)]
+
+        # The first page is the whole first shard
+        resp = self.app.get('/orders/?limit=2')
+        assert json.loads(resp.data.decode()) == orders[:2]
+
+        resp = self.app.get('/orders/?limit=2&cursor={}'.format(
+            resp.headers['X-Next-Cursor']))
+        assert json.loads(resp.data.decode()) == orders[2:]
+        assert 'X-Next-Cursor' not in resp.headers
+
+        # No empty page when the shards left have no orders
+        self.setup_method()
+        orders = [self.create_order(0) for _ in range(2)]
+        resp = self.app.get('/orders/?limit=2')
+        assert json.loads(resp.data.decode()) == orders
+        assert 'X-Next-Cursor' not in resp.headers
+
+    def test_get_orders__etag(self):
+        self.create_order(0)
+        resp = self.app.get('/orders/')
+        etag = resp.headers['ETag']
+
+        resp = self.app.get('/orders/', headers={'If-None-Match': etag})
+        assert resp.status_code == NOT_MODIFIED
+
+        # A write to the other shard changes the listing
+        self.create_order(1)
+        resp = self.app.get('/orders/', headers={'If-None-Match': etag})
+        assert resp.status_code == OK
+
+    def test_get_order(self):
+        order = self.create_order(1)
+
+        resp = self.app.get('/orders/{}'.format(order['uuid']))
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode()) == order
+
+        resp = self.app.get('/orders/{}'.format(uuid.uuid4()))
+        assert resp.status_code == NOT_FOUND
+
+    def test_update_order(self):
+        order = self.create_order(1)
+
+        resp = self.app.put('/orders/{}'.format(order['uuid']), data={
+            'items': json.dumps([[self.item.uuid, 5]]),
+        })
+        assert resp.status_code == OK
+        assert json.loads(resp.data.decode())['items'][0]['quantity'] == 5
+
+        with orders_database.using(1):
+            assert OrderItem.select().count() == 1
+            assert Order.get().json()['items'][0]['quantity'] == 5
+
+    def test_delete_order(self):
+        orders = [self.create_order(shard) for shard in range(SHARDS)]
+
+        resp = self.app.delete('/orders/{}'.format(orders[1]['uuid']))
+        assert resp.status_code == NO_CONTENT
+        assert self.shard_orders(0) == [orders[0]['uuid']]
+        assert self.shard_orders(1) == []
@@ -1,10 +1,11 @@
-from http.client import CREATED, NO_CONTENT, NOT_FOUND, BAD_REQUEST, UNAUTHORIZED
+from http.client import CREATED, NO_CONTENT, NOT_FOUND, BAD_REQUEST, UNAUTHORIZED, OK
 import json
 import uuid
 from views.user import crypt_password
 from peewee import SqliteDatabase
 from models import User
 from app import app
+import auth
 import base64
 
 
@@ -17,12 +18,22 @@ class Testuser:
 
     def setup_method(self):
         User.delete().execute()
+        auth.credentials.clear()
 
     def open_with_auth(self, url, method, email, password, data):
         return self.app.open(
             url, method=method, headers={'Authorization': 'Basic ' + base64.b64encode(
                 bytes(email + ":" + password, 'ascii')).decode('ascii')}, data=data)
 
+    def open_with_token(self, url, method, token, data):
+        return self.app.open(
+            url, method=method, headers={'Authorization': 'Bearer ' + token}, data=data)
+
+    def login(self, email, password):
+        resp = self.open_with_auth('/login', 'post', email, password, data='')
+        assert resp.status_code == OK
+        return json.loads(resp.data.decode())['token']
+
     def test_post__success_empty_db(self):
         data = {
             'first_name': 'Alessandro',
@@ -263,3 +274,142 @@ class Testuser:
         resp = self.open_with_auth(
             '/users/{}'.format(user.uuid), 'delete', user2.email, '1234567', data='')
         assert resp.status_code == UNAUTHORIZED
+
+    def test_credentials_cached(self):
+        user = User.create(
+            uuid=uuid.uuid4(),
+            first_name='Maria',
+            last_name='Rossi',
+            email='maria@rossi.com',
+            password=crypt_password('1234567')
+        )
+
+        with app.test_request_context():
+            assert auth.verify_pw(user.email, '1234567')
+            assert auth.verify_pw(user.email, '1234567')
+            assert not auth.verify_pw(user.email, '1234568')
+            assert not auth.verify_pw('maria@rossi.it', '1234567')
+
+        assert len(auth.credentials) == 1
+        assert auth.credentials.stats()['hits'] >= 1
+
+    def test_credentials_cache__password_changed(self):
+        user = User.create(
+            uuid=uuid.uuid4(),
+            first_name='Maria',
+            last_name='Rossi',
+            email='maria@rossi.com',
+            password=crypt_password('1234567')
+        )
+        data = {
+            'first_name': 'Maria',
+            'last_name': 'Rossi',
+            'email': 'maria@rossi.com',
+            'password': 'new password'
+        }
+
+        resp = self.open_with_auth(
+            '/users/{}'.format(user.uuid), 'put', user.email, '1234567', data=data)
+        assert resp.status_code == CREATED
+        assert len(auth.credentials) == 0
+
+        resp = self.open_with_auth(
+            '/users/{}'.format(user.uuid), 'put', user.email, '1234567', data=data)
+        assert resp.status_code == UNAUTHORIZED
+
+        resp = self.open_with_auth(
+            '/users/{}'.format(user.uuid), 'delete', user.email, 'new password', data='')
+        assert resp.status_code == NO_CONTENT
+
+        resp = self.open_with_auth(
+            '/users/{}'.format(user.uuid), 'delete', user.email, 'new password', data='')
+        assert resp.status_code == UNAUTHORIZED
+
+    def test_login(self):
+        user = User.create(
+            uuid=uuid.uuid4(),
+            first_name='Maria',
+            last_name='Rossi',
+            email='maria@rossi.com',
+            password=crypt_password('1234567')
+        )
+        data = {
+            'first_name': 'Anna',
+            'last_name': 'Rossi',
+            'email': 'maria@rossi.com',
+            'password': '1234567'
+        }
+
+        resp = self.open_with_auth('/login', 'post', user.email, '1234568', data='')
+        assert resp.status_code == UNAUTHORIZED
+
+        token = self.login(user.email, '1234567')
+        resp = self.open_with_token('/users/{}'.format(user.uuid), 'put', token, data=data)
+        assert resp.status_code == CREATED
+        assert User.get().first_name == 'Anna'
+
+        resp = self.open_with_token('/users/{}'.format(user.uuid), 'delete', token, data='')
+        assert resp.status_code == NO_CONTENT
+
+    def test_login__invalid_token(self, monkeypatch):
+        user = User.create(
+            uuid=uuid.uuid4(),
+            first_name='Maria',
+            last_name='Rossi',
+            email='maria@rossi.com',
+            password=crypt_password('1234567')
+        )
+        user2 = User.create(
+            uuid=uuid.uuid4(),
+            first_name='Alessandro',
+            last_name='Cappellini',
+            email='abc@abc.com',
+            password=crypt_password('1234567')
+        )
+        token = self.login(user.email, '1234567')
+
+        resp = self.open_with_token('/users/{}'.format(user.uuid), 'delete', token[:-2], data='')
+        assert resp.status_code == UNAUTHORIZED
+
+        resp = self.open_with_token('/users/{}'.format(user2.uuid), 'delete', token, data='')
+        assert resp.status_code == UNAUTHORIZED
+
+        monkeypatch.setattr(auth, 'TOKEN_TTL', -1)
+        resp = self.open_with_token('/users/{}'.format(user.uuid), 'delete', token, data='')
+        assert resp.status_code == UNAUTHORIZED
+        assert User.select().count() == 2
+
+    def test_login__token_of_deleted_user(self):
+        user = User.create(
+            uuid=uuid.uuid4(),
+            first_name='Maria',
+            last_name='Rossi',
+            email='maria@rossi.com',
+            password=crypt_password('1234567')
+        )
+        token = self.login(user.email, '1234567')
+        resp = self.open_with_token('/users/{}'.format(user.uuid), 'delete', token, data='')
+        assert resp.status_code == NO_CONTENT
+
+        # SQLite gives the id of the deleted user to the next one
+        resp = self.app.post('/users/', data={
+            'first_name': 'Alessandro',
+            'last_name': 'Cappellini',
+            'email': 'abc@abc.com',
+            'password': '7654321'
+        })
+        assert resp.status_code == CREATED
+        new_user = User.get(User.email == 'abc@abc.com')
+        assert new_user.id == user.id
+
+        data = {
+            'first_name': 'Anna',
+            'last_name': 'Rossi',
+            'email': 'maria@rossi.com',
+            'password': '1234567'
+        }
+        resp = self.open_with_token('/users/{}'.format(new_user.uuid), 'put', token, data=data)
+        assert resp.status_code == UNAUTHORIZED
+        resp = self.open_with_token('/users/{}'.format(new_user.uuid), 'delete', token, data='')
+        assert resp.status_code == UNAUTHORIZED
+        assert User.get().first_name == 'Alessandro'
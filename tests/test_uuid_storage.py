@@ -0,0 +1,154 @@
+import json
+import types
+import uuid
+from http.client import OK, CREATED, BAD_REQUEST
+from peewee import Model, SqliteDatabase
+from app import app
+from models import BinaryUUIDField, Item, User, Address, Order, OrderItem, TableVersion
+import catalog
+import migrations
+
+
+class Thing(Model):
+    uuid = BinaryUUIDField(unique=True)
+
+
+class TestBinaryUUIDField:
+    @classmethod
+    def setup_class(cls):
+        Thing._meta.database = SqliteDatabase(':memory:')
+        Thing.create_table()
+
+    def setup_method(self):
+        Thing.delete().execute()
+
+    def test_lookup(self):
+        thing_uuid = uuid.uuid4()
+        Thing.create(uuid=thing_uuid)
+        Thing.create(uuid=str(uuid.uuid4()))
+
+        assert Thing.get(Thing.uuid == thing_uuid).uuid == thing_uuid
+        assert Thing.get(Thing.uuid == str(thing_uuid)).uuid == thing_uuid
+        assert Thing.select().where(Thing.uuid << [str(thing_uuid)]).count() == 1
+
+        stored, = Thing._meta.database.execute_sql(
+            'SELECT uuid FROM thing WHERE id = ?', (Thing.get(Thing.uuid == thing_uuid).id,)
+        ).fetchone()
+        assert bytes(stored) == thing_uuid.bytes
+
+    def test_lookup__malformed(self):
+        Thing.create(uuid=uuid.uuid4())
+
+        assert Thing.select().where(Thing.uuid == 'not a uuid').count() == 0
+        assert Thing.select().where(Thing.uuid << ['not a uuid']).count() == 0
+
+
+class TestBinaryUUIDRequests:
+    @classmethod
+    def setup_class(cls):
+        database = SqliteDatabase(':memory:')
+        for table in [User, Address, Item, Order, OrderItem, TableVersion]:
+            table._meta.database = database
+            table.create_table()
+
+        # Store the uuids as with ECOMMERCE_UUID_STORAGE=binary
+        cls.fields = [model.uuid for model in migrations.UUID_MODELS]
+        for field in cls.fields:
+            field.db_value = types.MethodType(BinaryUUIDField.db_value, field)
+            field.python_value = types.MethodType(BinaryUUIDField.python_value, field)
+
+        cls.user = User.create(
+            uuid=uuid.uuid4(),
+            first_name='Name',
+            last_name='Surname',
+            email='email@domain.com',
+            password='password',
+        )
+        cls.item = Item.create(
+            uuid=uuid.uuid4(),
+            name='Item one',
+            price=10,
+            description='Item one description',
+            category='Category one',
+        )
+
+        catalog.clear()
+        app.config['TESTING'] = True
+        cls.app = app.test_client()
+
+    @classmethod
+    def teardown_class(cls):
+        for field in cls.fields:
+            del field.db_value
+            del field.python_value
+        catalog.clear()
+
+    def post_order(self, items):
+        return self.app.post('/orders/', data={
+            'user': str(self.user.uuid),
+            'items': json.dumps(items),
+        })
+
+    def test_post_address__malformed_user(self):
+        resp = self.app.post('/addresses/', data={
+            'user_id': 'not a uuid',
+            'nation': 'Italia',
+            'city': 'Prato',
+            'postal_code': '59100',
+            'local_address': 'Via Roncioni 10',
+            'phone': '0574100100',
+        })
+        assert resp.status_code == BAD_REQUEST
+
+    def test_post_order__malformed_item(self):
+        resp = self.post_order([['not a uuid', 1]])
+        assert resp.status_code == BAD_REQUEST
+
+    def test_put_order__malformed_item(self):
+        resp = self.post_order([[str(self.item.uuid), 1]])
+        assert resp.status_code == CREATED
+        order = json.loads(resp.data.decode())
+
+        resp = self.app.put('/orders/{}'.format(order['uuid']), data={
+            'items': json.dumps([['not a uuid', 1]]),
+        })
+        assert resp.status_code == BAD_REQUEST
+
+    def test_post_orders_batch__malformed_item(self):
+        resp = self.app.post('/orders/batch', data={'orders': json.dumps([
+            {'user': str(self.user.uuid), 'items': [['not a uuid', 1]]},
+            {'user': str(self.user.uuid), 'items': [[str(self.item.uuid), 1]]},
+        ])})
+        assert resp.status_code == OK
+
+        results = json.loads(resp.data.decode())
+        assert [result['status'] for result in results] == [BAD_REQUEST, CREATED]
+
+
+class TestConvertUUIDs:
+    @classmethod
+    def setup_class(cls):
+        cls.database = SqliteDatabase(':memory:')
+        Item._meta.database = cls.database
+        Item.create_table()
+
+    def setup_method(self):
+        Item.delete().execute()
+
+    def test_convert(self):
+        items = [Item.create(
+            uuid=uuid.uuid4(),
+            name='Item {}'.format(i),
+            price=5,
+            description='Description',
+            category='Category one'
+        ) for i in range(5)]
+
+        assert migrations.convert_uuids(self.database, True, [Item], batch_size=2) == 5
+        assert migrations.convert_uuids(self.database, True, [Item]) == 0
+        types = self.database.execute_sql('SELECT DISTINCT typeof(uuid) FROM item').fetchall()
+        assert types == [('blob',)]
+
+        assert migrations.convert_uuids(self.database, False, [Item]) == 5
+        for item in items:
+            assert Item.get(Item.uuid == item.uuid).name == item.name
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import threading
+import uuid
+import pytest
+from peewee import SqliteDatabase
+
+from models import Item, TableVersion
+from writer import WriteCoordinator
+
+
+def create_item(name):
+    if not name:
+        raise ValueError('The item needs a name')
+
+    return Item.create(
+        uuid=uuid.uuid4(),
+        name=name,
+        price=10,
+        description='Description',
+        category='Category one',
+    )
+
+
+class TestWriteCoordinator:
+    @classmethod
+    def setup_class(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.database = SqliteDatabase(os.path.join(cls.directory.name, 'test.db'))
+        for table in [Item, TableVersion]:
+            table._meta.database = cls.database
+            table.create_table()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.database.close()
+        cls.directory.cleanup()
+
+    def setup_method(self):
+        Item.delete().execute()
+        self.coordinator = WriteCoordinator(self.database)
+        self.coordinator.start()
+
+    def teardown_method(self):
+        self.coordinator.stop()
+
+    def test_submit(self):
+        item = self.coordinator.submit(create_item, 'Item one')
+        assert Item.get(Item.uuid == item.uuid).name == 'Item one'
+
+    def test_submit__concurrent(self):
+        threads = [
+            threading.Thread(target=self.coordinator.submit, args=(create_item, str(i)))
+            for i in range(50)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(Item.select()) == 50
+        assert self.coordinator.stats()['writes'] == 50
+
+    def test_submit__failure_isolated(self):
+        with pytest.raises(ValueError):
+            self.coordinator.submit(create_item, '')
+
+        self.coordinator.submit(create_item, 'Item one')
+        assert [item.name for item in Item.select()] == ['Item one']
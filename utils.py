@@ -1,4 +1,51 @@
-def non_empty_str(val, name):
+def non_empty_str(val, name='value'):
     if not str(val).strip():
         raise ValueError('The argument {} is not empty'.format(name))
     return str(val)
+
+
+# SQLite binds at most 999 variables per statement
+MAX_VARIABLES = 999
+# Values of an IN list, leaving room for the other variables of the query
+IN_BATCH_SIZE = 900
+
+
+def insert_batch_size(columns):
+    """Rows of `columns` values that a single INSERT can bind."""
+    return MAX_VARIABLES // columns
+
+
+def chunked(iterable, size):
+    chunk = []
+    for element in iterable:
+        chunk.append(element)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def fieldset(fields, getters):
+    """
+    Build a JSON object from the `getters` of its fields, calling only those
+    of `fields`, or all of them when `fields` is None.
+    """
+    return {name: get() for name, get in getters.items() if fields is None or name in fields}
+
+
+def pick(data, fields):
+    if fields is None:
+        return data
+    return {name: value for name, value in data.items() if name in fields}
+
+
+def field_list(allowed):
+    """Argument type parsing a comma separated subset of the `allowed` fields."""
+    def parse(value):
+        fields = tuple(field.strip() for field in str(value).split(',') if field.strip())
+        unknown = set(fields) - set(allowed)
+        if not fields or unknown:
+            raise ValueError('The fields must be some of {}'.format(', '.join(allowed)))
+        return fields
+    return parse
@@ -1,32 +1,39 @@
 import uuid
 from models import User, Address
 from http.client import CREATED, NOT_FOUND, NO_CONTENT, BAD_REQUEST, OK
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
+import conditional
+from schemas import Schema, Field, ARGS
 import utils
+import writer
+
+
+ADDRESS_SCHEMA = Schema(
+    # TODO Security issue, grab user_id from user authentication
+    user_id=Field(utils.non_empty_str, required=True),
+    nation=Field(utils.non_empty_str, required=True, min_length=3),
+    city=Field(utils.non_empty_str, required=True, min_length=3),
+    postal_code=Field(utils.non_empty_str, required=True, min_length=3),
+    local_address=Field(utils.non_empty_str, required=True, min_length=3),
+    phone=Field(utils.non_empty_str, required=True, min_length=3),
+)
+
+ADDRESS_QUERY_SCHEMA = Schema(
+    fields=Field(utils.field_list(Address.json_fields), location=ARGS),
+)
 
 
 class AddressesResource(Resource):
     def post(self):
-        parser = reqparse.RequestParser()
-        # TODO Security issue, grab user_id from user authentication
-        parser.add_argument('user_id', type=utils.non_empty_str, required=True)
-        parser.add_argument('nation', type=utils.non_empty_str, required=True)
-        parser.add_argument('city', type=utils.non_empty_str, required=True)
-        parser.add_argument('postal_code', type=utils.non_empty_str, required=True)
-        parser.add_argument('local_address', type=utils.non_empty_str, required=True)
-        parser.add_argument('phone', type=utils.non_empty_str, required=True)
-        args = parser.parse_args(strict=True)
-
-        for parm in ['nation', 'city', 'postal_code', 'local_address', 'phone']:
-            if len(args[parm]) < 3:
-                return '', BAD_REQUEST
+        args = ADDRESS_SCHEMA.parse()
 
         try:
             user = User.get(User.uuid == args['user_id'])
         except User.DoesNotExist:
             return '', BAD_REQUEST
 
-        address = Address.create(
+        address = writer.submit(
+            Address.create,
             uuid=uuid.uuid4(),
             user=user,
             nation=args['nation'],
@@ -41,12 +48,22 @@ class AddressesResource(Resource):
 
 class AddressResource(Resource):
     def get(self, address_id):
+        args = ADDRESS_QUERY_SCHEMA.parse()
+
         try:
-            address = Address.get(Address.uuid == address_id)
+            address = (Address
+                       .select_json(args['fields'])
+                       .where(Address.uuid == address_id)
+                       .get())
         except Address.DoesNotExist:
             return None, NOT_FOUND
 
-        return address.json(), OK
+        etag = conditional.row_etag(address)
+        response = conditional.not_modified(etag)
+        if response is not None:
+            return response
+
+        return address.json(args['fields']), OK, conditional.headers(etag)
 
     def put(self, address_id):
         try:
@@ -54,19 +71,7 @@ class AddressResource(Resource):
         except Address.DoesNotExist:
             return None, NOT_FOUND
 
-        parser = reqparse.RequestParser()
-        # TODO Security issue, grab user_id from user authentication
-        parser.add_argument('user_id', type=utils.non_empty_str, required=True)
-        parser.add_argument('nation', type=utils.non_empty_str, required=True)
-        parser.add_argument('city', type=utils.non_empty_str, required=True)
-        parser.add_argument('postal_code', type=utils.non_empty_str, required=True)
-        parser.add_argument('local_address', type=utils.non_empty_str, required=True)
-        parser.add_argument('phone', type=utils.non_empty_str, required=True)
-        args = parser.parse_args(strict=True)
-
-        for parm in ['nation', 'city', 'postal_code', 'local_address', 'phone']:
-            if len(args[parm]) < 3:
-                return '', BAD_REQUEST
+        args = ADDRESS_SCHEMA.parse()
 
         if str(address.user.uuid) == args['user_id']:
             address.nation = args['nation']
@@ -74,7 +79,7 @@ class AddressResource(Resource):
             address.postal_code = args['postal_code']
             address.local_address = args['local_address']
             address.phone = args['phone']
-            address.save()
+            writer.submit(address.save)
 
             return address.json(), CREATED
         else:
@@ -86,5 +91,5 @@ class AddressResource(Resource):
         except Address.DoesNotExist:
             return None, NOT_FOUND
 
-        address.delete_instance()
+        writer.submit(address.delete_instance)
         return None, NO_CONTENT
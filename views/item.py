@@ -1,56 +1,230 @@
-from flask_restful import Resource, reqparse
+from flask import request, Response
+from flask_restful import Resource, inputs
 from http.client import CREATED
 from http.client import NO_CONTENT
 from http.client import NOT_FOUND
 from http.client import OK
 from http.client import BAD_REQUEST
+from http.client import UNSUPPORTED_MEDIA_TYPE
 import uuid
-from models import Item
+from peewee import fn
+from models import Item, Picture, database
+import catalog
+import conditional
+import importer
+import pagination
+import pictures
+from schemas import Schema, Field, ARGS
+import search
+import streaming
 import utils
+import writer
+
+
+# Sort orders of the listing, with the key they are paginated by
+SORT_KEYS = {
+    'id': ((Item.id,), False),
+    'price': ((Item.price, Item.id), False),
+    '-price': ((Item.price, Item.id), True),
+}
+
+
+ITEM_SCHEMA = Schema(
+    name=Field(utils.non_empty_str, required=True),
+    price=Field(int, required=True),
+    description=Field(str, required=True),
+    category=Field(str, required=True),
+)
+
+ITEMS_QUERY_SCHEMA = Schema(
+    limit=Field(int, location=ARGS),
+    cursor=Field(str, location=ARGS),
+    stream=Field(inputs.boolean, default=False, location=ARGS),
+    category=Field(str, location=ARGS),
+    min_price=Field(int, location=ARGS),
+    max_price=Field(int, location=ARGS),
+    sort=Field(choices=SORT_KEYS, default='id', location=ARGS),
+    fields=Field(utils.field_list(Item.json_fields), location=ARGS),
+)
+
+FACETS_QUERY_SCHEMA = Schema(
+    min_price=Field(int, location=ARGS),
+    max_price=Field(int, location=ARGS),
+)
+
+SEARCH_QUERY_SCHEMA = Schema(
+    q=Field(utils.non_empty_str, required=True, location=ARGS),
+    limit=Field(int, location=ARGS),
+    cursor=Field(str, location=ARGS),
+)
+
+ITEM_QUERY_SCHEMA = Schema(
+    fields=Field(utils.field_list(Item.json_fields), location=ARGS),
+)
+
+
+def filter_items(query, args):
+    if args['category'] is not None:
+        query = query.where(Item.category == args['category'])
+    if args['min_price'] is not None:
+        query = query.where(Item.price >= args['min_price'])
+    if args['max_price'] is not None:
+        query = query.where(Item.price <= args['max_price'])
+    return query
+
+
+def items_response(items, fields, headers):
+    if fields is not None:
+        return [obj.json(fields) for obj in items], OK, headers
+    # Join the cached encodings of the items instead of serializing them
+    return streaming.fragments_response((catalog.fragment(obj) for obj in items), headers)
+
+
+def delete_item(item):
+    """Delete the item along with its pictures, returning the pictures."""
+    with database.atomic():
+        item_pictures = list(Picture.select().where(Picture.item == item.id))
+        Picture.delete().where(Picture.item == item.id).execute()
+        item.delete_instance()
+    return item_pictures
 
 
 class ItemsResource(Resource):
     def get(self):
-        return [obj.json() for obj in Item.select()], OK
+        args = ITEMS_QUERY_SCHEMA.parse()
+
+        key, descending = SORT_KEYS[args['sort']]
+        order = [field.desc() if descending else field.asc() for field in key]
+        query = filter_items(Item.select_json(args['fields']), args)
+        filtered = args['sort'] != 'id' or any(
+            args[name] is not None for name in ('category', 'min_price', 'max_price'))
+
+        if args['stream']:
+            if args['limit'] is not None or args['cursor'] is not None:
+                return None, BAD_REQUEST
+            items = query.order_by(*order).iterator()
+            return streaming.json_response(obj.json(args['fields']) for obj in items)
+
+        # The cached item list is tagged with the version it was read at
+        version = conditional.table_version(Item)
+        etag = conditional.table_etag(Item, version)
+        response = conditional.not_modified(etag)
+        if response is not None:
+            return response
+
+        if args['limit'] is None and args['cursor'] is None:
+            if filtered:
+                items = query.order_by(*order)
+            else:
+                items = catalog.get_item_list(version)
+            return items_response(items, args['fields'], conditional.headers(etag))
 
-    def post(self):
-        parser = reqparse.RequestParser()
-        parser.add_argument('name', type=str, required=True)
-        parser.add_argument('price', type=int, required=True)
-        parser.add_argument('description', type=str, required=True)
-        parser.add_argument('category', type=str, required=True)
-        args = parser.parse_args(strict=True)
         try:
-            utils.non_empty_str(args['name'], 'name')
+            query, next_cursor = pagination.paginate(
+                query, key, args['limit'], args['cursor'], descending)
         except ValueError:
             return None, BAD_REQUEST
 
-        obj = Item.create(
+        headers = dict(pagination.headers(next_cursor), **conditional.headers(etag))
+        return items_response(query, args['fields'], headers)
+
+    def post(self):
+        args = ITEM_SCHEMA.parse()
+
+        obj = writer.submit(
+            Item.create,
             uuid=uuid.uuid4(),
             name=args["name"],
             price=args["price"],
             description=args["description"],
             category=args["category"]
         )
+        catalog.update(obj)
 
         return obj.json(), CREATED
 
 
+class ItemsImportResource(Resource):
+    READERS = {
+        'application/x-ndjson': importer.read_ndjson,
+        'text/csv': importer.read_csv,
+    }
+
+    def post(self):
+        try:
+            reader = self.READERS[request.mimetype]
+        except KeyError:
+            return None, UNSUPPORTED_MEDIA_TYPE
+
+        # Read the body line by line rather than loading it in memory
+        rows = reader(importer.decode_lines(request.stream))
+        return importer.import_items(rows), OK
+
+
+class ItemFacetsResource(Resource):
+    def get(self):
+        args = FACETS_QUERY_SCHEMA.parse()
+
+        etag = conditional.table_etag(Item)
+        response = conditional.not_modified(etag)
+        if response is not None:
+            return response
+
+        # Number of items per category, counted on the (category, price) index
+        query = (filter_items(Item.select(Item.category, fn.COUNT(Item.id)),
+                              dict(args, category=None))
+                 .group_by(Item.category)
+                 .order_by(Item.category))
+
+        return dict(query.tuples()), OK, conditional.headers(etag)
+
+
+class ItemSearchResource(Resource):
+    def get(self):
+        args = SEARCH_QUERY_SCHEMA.parse()
+
+        def fetch(limit, offset):
+            return search.search(args['q'], limit, offset)
+
+        try:
+            items, next_cursor = pagination.ranked_page(fetch, args['limit'], args['cursor'])
+        except ValueError:
+            return None, BAD_REQUEST
+
+        return [obj.json() for obj in items], OK, pagination.headers(next_cursor)
+
+
 class ItemResource(Resource):
 
     def get(self, uuid):
+        args = ITEM_QUERY_SCHEMA.parse()
+
         try:
-            return Item.get(Item.uuid == uuid).json(), OK
+            item = catalog.get_item(uuid)
         except Item.DoesNotExist:
             return None, NOT_FOUND
 
+        etag = conditional.row_etag(item)
+        response = conditional.not_modified(etag)
+        if response is not None:
+            return response
+
+        if args['fields'] is not None:
+            return item.json(args['fields']), OK, conditional.headers(etag)
+
+        return Response(catalog.fragment(item), mimetype='application/json',
+                        headers=conditional.headers(etag))
+
     def delete(self, uuid):
         try:
             item = Item.get(Item.uuid == uuid)
         except Item.DoesNotExist:
             return None, NOT_FOUND
 
-        item.delete_instance()
+        item_pictures = writer.submit(delete_item, item)
+        catalog.invalidate(uuid)
+        for picture in item_pictures:
+            pictures.delete(picture.uuid, picture.extension)
         return None, NO_CONTENT
 
     def put(self, uuid):
@@ -59,21 +233,13 @@ class ItemResource(Resource):
         except Item.DoesNotExist:
             return None, NOT_FOUND
 
-        parser = reqparse.RequestParser()
-        parser.add_argument('name', type=str, required=True)
-        parser.add_argument('price', type=int, required=True)
-        parser.add_argument('description', type=str, required=True)
-        parser.add_argument('category', type=str, required=True)
-        args = parser.parse_args(strict=True)
-        try:
-            utils.non_empty_str(args['name'], 'name')
-        except ValueError:
-            return None, BAD_REQUEST
+        args = ITEM_SCHEMA.parse()
 
         obj.name = args["name"]
         obj.price = args["price"]
         obj.description = args["description"]
         obj.category = args["category"]
-        obj.save()
+        writer.submit(obj.save)
+        catalog.update(obj)
 
         return obj.json(), OK
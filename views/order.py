@@ -1,9 +1,36 @@
-from flask_restful import reqparse, Resource
+from collections import defaultdict
+from flask import request
+from flask_restful import Resource, inputs
 from http.client import OK, NOT_FOUND, NO_CONTENT, CREATED, BAD_REQUEST
+from http.client import CONFLICT, UNPROCESSABLE_ENTITY, INTERNAL_SERVER_ERROR
+import datetime
+import hashlib
 import uuid
 import json
 
-from models import Order, OrderItem, Item, User, database
+from peewee import IntegrityError
+
+from models import Order, OrderItem, User, IdempotencyKey, TableVersion, orders_database
+import catalog
+import conditional
+import pagination
+from schemas import Schema, Field, ARGS
+import streaming
+import utils
+import writer
+
+# Order items rows carry 4 columns
+ORDERS_BATCH_SIZE = utils.insert_batch_size(5)
+ORDER_ITEMS_BATCH_SIZE = utils.insert_batch_size(4)
+
+MAX_BATCH_ORDERS = 5000
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENT_REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+# Seconds the response of an order created with an idempotency key is kept
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
 
 
 def is_valid_uuid(user_id):
@@ -11,116 +38,416 @@ def is_valid_uuid(user_id):
 
 
 def is_valid_item_list(json_item_list):
+    # A JSON string in form bodies, already decoded in JSON ones
+    if isinstance(json_item_list, list):
+        return json_item_list
     return json.loads(json_item_list)
 
 
+def is_valid_order_list(json_order_list):
+    orders = json_order_list
+    if not isinstance(orders, list):
+        orders = json.loads(json_order_list)
+    if not isinstance(orders, list) or len(orders) > MAX_BATCH_ORDERS:
+        raise ValueError('The orders must be a list of at most {} orders'.format(
+            MAX_BATCH_ORDERS))
+    return orders
+
+
+ORDER_SCHEMA = Schema(
+    user=Field(is_valid_uuid, required=True),
+    items=Field(is_valid_item_list, required=True),
+)
+
+ORDER_ITEMS_SCHEMA = Schema(
+    items=Field(is_valid_item_list, required=True),
+)
+
+ORDERS_BATCH_SCHEMA = Schema(
+    orders=Field(is_valid_order_list, required=True),
+)
+
+ORDERS_QUERY_SCHEMA = Schema(
+    limit=Field(int, location=ARGS),
+    cursor=Field(str, location=ARGS),
+    stream=Field(inputs.boolean, default=False, location=ARGS),
+    fields=Field(utils.field_list(Order.json_fields), location=ARGS),
+)
+
+ORDER_QUERY_SCHEMA = Schema(
+    fields=Field(utils.field_list(Order.json_fields), location=ARGS),
+)
+
+
+def cart_quantities(items):
+    """
+    Map the item uuids of a `[[item_uuid, quantity], ...]` cart to their
+    quantities, or return None if the cart is empty, malformed or repeats
+    an item.
+    """
+    try:
+        quantities = {item_uuid: quantity for item_uuid, quantity in items}
+    except (TypeError, ValueError):
+        return None
+
+    if len(quantities) == 0 or len(quantities) != len(items):
+        return None
+
+    return quantities
+
+
+def fetch_users(users_uuid):
+    users = {}
+    for batch in utils.chunked(users_uuid, utils.IN_BATCH_SIZE):
+        query = User.select(User.id, User.uuid).where(User.uuid << batch)
+        users.update((str(user.uuid), user) for user in query)
+    return users
+
+
+def price_lines(quantities, items):
+    """
+    Build the unsaved order items of a cart from the already fetched
+    `items`, by uuid, or return None if an item is unknown or a quantity
+    invalid.
+    """
+    lines = []
+    for item_uuid, quantity in quantities.items():
+        item = items.get(item_uuid)
+        if item is None:
+            return None
+        try:
+            subtotal = float(item.price * quantity)
+        except TypeError:
+            return None
+        lines.append(OrderItem(item=item, quantity=quantity, subtotal=subtotal))
+    return lines
+
+
+def order_lines(items):
+    quantities = cart_quantities(items)
+    if quantities is None:
+        return None
+    return price_lines(quantities, catalog.get_items(quantities))
+
+
+def order_total(lines):
+    return sum(line.subtotal for line in lines)
+
+
+def order_item_rows(order, lines):
+    for line in lines:
+        yield {
+            OrderItem.order: order.id,
+            OrderItem.item: line.item.id,
+            OrderItem.quantity: line.quantity,
+            OrderItem.subtotal: line.subtotal,
+        }
+
+
+def insert_order_items(rows):
+    for batch in utils.chunked(rows, ORDER_ITEMS_BATCH_SIZE):
+        OrderItem.insert_many(batch).execute()
+
+
+def create_orders(orders):
+    """
+    Write the `(user, lines)` pairs of `orders` in a single transaction of
+    the current shard.
+    """
+    created = []
+    for user, lines in orders:
+        order = Order(
+            uuid=uuid.uuid4(),
+            total_price=order_total(lines),
+            user=user.id
+        )
+        order.take_snapshot(user, [line.json() for line in lines])
+        created.append(order)
+
+    with orders_database.atomic():
+        for batch in utils.chunked(created, ORDERS_BATCH_SIZE):
+            insert_orders(batch)
+        insert_order_items(
+            row for order, (_, lines) in zip(created, orders)
+            for row in order_item_rows(order, lines))
+
+        # Bump the version like Order.save() does, once for all the orders
+        TableVersion.bump(Order._meta.db_table, orders_database)
+
+    return created
+
+
+def insert_orders(orders):
+    Order.insert_many([{
+        Order.uuid: order.uuid,
+        Order.total_price: order.total_price,
+        Order.user: order.user_id,
+        Order.snapshot: order.snapshot,
+        Order.version: order.version,
+    } for order in orders]).execute()
+
+    ids = dict(Order
+               .select(Order.uuid, Order.id)
+               .where(Order.uuid << [order.uuid for order in orders])
+               .tuples())
+    for order in orders:
+        order.id = ids[order.uuid]
+
+
+def write_orders(orders):
+    """
+    Create the `(user, lines)` pairs of `orders` in the shards of their
+    users, one transaction per shard. Return, in the same order, the
+    created orders, or the exception of the shard whose transaction failed:
+    the orders of the other shards are committed all the same.
+    """
+    positions = defaultdict(list)
+    for position, (user, _) in enumerate(orders):
+        positions[orders_database.shard_for(user.id)].append(position)
+
+    created = [None] * len(orders)
+    for shard, shard_positions in sorted(positions.items()):
+        try:
+            shard_orders = writer.submit_to_shard(
+                shard, create_orders, [orders[position] for position in shard_positions])
+        except Exception as exc:
+            shard_orders = [exc] * len(shard_positions)
+        for position, order in zip(shard_positions, shard_orders):
+            created[position] = order
+    return created
+
+
+def write_result(order):
+    """Result of an order of a batch, as returned by write_orders."""
+    if isinstance(order, Exception):
+        status = getattr(order, 'code', None) or INTERNAL_SERVER_ERROR
+        return {'status': status, 'error': 'order not written'}
+    return {'status': CREATED, 'order': order.json()}
+
+
+def update_order(order, user, lines):
+    with orders_database.atomic():
+        OrderItem.delete().where(OrderItem.order == order.id).execute()
+        insert_order_items(order_item_rows(order, lines))
+
+        order.total_price = order_total(lines)
+        order.take_snapshot(user, [line.json() for line in lines])
+        order.save()
+
+
+def delete_order(order):
+    with orders_database.atomic():
+        OrderItem.delete().where(OrderItem.order == order.id).execute()
+        order.delete_instance()
+
+
+def create_order_once(user, lines, key, fingerprint):
+    """
+    Create the order of `user` and record its response under the
+    idempotency `key`, in the same transaction of the current shard. Raise
+    IntegrityError, writing nothing, when the key is already recorded.
+    """
+    now = datetime.datetime.utcnow()
+    with orders_database.atomic():
+        IdempotencyKey.delete().where(IdempotencyKey.expires_at < now).execute()
+        order, = create_orders([(user, lines)])
+        IdempotencyKey.create(
+            key=key,
+            fingerprint=fingerprint,
+            response=json.dumps(order.json()),
+            expires_at=now + datetime.timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+        )
+    return order
+
+
+def find_order(order_uuid, query=None):
+    """
+    Return the shard of the order with `order_uuid` and the order, read by
+    `query` (all its columns by default), or raise Order.DoesNotExist.
+    """
+    query = Order.select() if query is None else query
+    return orders_database.find(
+        lambda: query.where(Order.uuid == order_uuid).get(), Order.DoesNotExist)
+
+
 class OrdersResource(Resource):
     def post(self):
-        parser = reqparse.RequestParser()
-        parser.add_argument('user', type=is_valid_uuid, required=True)
-        parser.add_argument('items', type=is_valid_item_list, required=True)
-        args = parser.parse_args(strict=True)
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        fingerprint = None
+        if key is not None:
+            if not key or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+                return None, BAD_REQUEST
+            # A key can only be reused to retry the very same request. The
+            # body is read before the form parsing consumes the stream.
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        args = ORDER_SCHEMA.parse()
 
         try:
             user = User.get(User.uuid == args['user'])
         except User.DoesNotExist:
             return None, BAD_REQUEST
 
-        total_price = 0
+        # The key is kept in the shard of the user
+        shard = orders_database.shard_for(user.id)
+        if key is not None:
+            response = self._replay(shard, key, fingerprint)
+            if response is not None:
+                return response
 
-        items = args['items']
-        items_uuid = [i[0] for i in items]
-        items_query = Item.select().where(Item.uuid << items_uuid)
-
-        if items_query.count() != len(items) or len(items) == 0:
+        lines = order_lines(args['items'])
+        if lines is None:
             return None, BAD_REQUEST
 
-        for item in items_query:
-            item_quantity = [x[1] for x in items if x[0] == str(item.uuid)][0]
-            total_price += float(item.price * item_quantity)
-
-        with database.transaction():
-            order = Order.create(
-                uuid=uuid.uuid4(),
-                total_price=total_price,
-                user=user.id
-            )
-
-            for item in items_query:
-                item_quantity = [x[1] for x in items if x[0] == str(item.uuid)][0]
-                OrderItem.create(
-                    order=order.id,
-                    item=item.id,
-                    quantity=item_quantity,
-                    subtotal=float(item.price * item_quantity)
-                )
+        if key is None:
+            order, = writer.submit_to_shard(shard, create_orders, [(user, lines)])
+            return order.json(), CREATED
 
+        try:
+            order = writer.submit_to_shard(
+                shard, create_order_once, user, lines, key, fingerprint)
+        except IntegrityError:
+            # A request with the same key was committed first
+            return self._replay(shard, key, fingerprint) or (None, CONFLICT)
         return order.json(), CREATED
 
+    @staticmethod
+    def _replay(shard, key, fingerprint):
+        with orders_database.using(shard):
+            try:
+                stored = IdempotencyKey.get(
+                    (IdempotencyKey.key == key) &
+                    (IdempotencyKey.expires_at >= datetime.datetime.utcnow()))
+            except IdempotencyKey.DoesNotExist:
+                return None
+
+        if stored.fingerprint != fingerprint:
+            return None, UNPROCESSABLE_ENTITY
+        return json.loads(stored.response), CREATED, {IDEMPOTENT_REPLAYED_HEADER: 'true'}
+
     def get(self):
-        return [order.json() for order in Order.select()], OK
+        args = ORDERS_QUERY_SCHEMA.parse()
+        fields = args['fields']
+
+        # Scatter-gather over the shards: the orders are listed one shard
+        # after the other, each page serialized within its shard
+        def serialize(query):
+            return Order.json_list(query, fields)
+
+        if args['stream']:
+            if args['limit'] is not None or args['cursor'] is not None:
+                return None, BAD_REQUEST
+            return streaming.json_response(
+                orders_database.pages(Order.select(), Order.id, serialize))
+
+        etag = conditional.table_etag(Order)
+        response = conditional.not_modified(etag)
+        if response is not None:
+            return response
+
+        if args['limit'] is None and args['cursor'] is None:
+            orders = orders_database.gather(lambda: serialize(Order.select()))
+            return orders, OK, conditional.headers(etag)
+
+        try:
+            orders, next_cursor = orders_database.paginate(
+                Order.select(), Order.id, serialize, args['limit'], args['cursor'])
+        except ValueError:
+            return None, BAD_REQUEST
+
+        headers = dict(pagination.headers(next_cursor), **conditional.headers(etag))
+        return orders, OK, headers
+
+
+class OrdersBatchResource(Resource):
+    def post(self):
+        args = ORDERS_BATCH_SCHEMA.parse()
+
+        carts = [self._parse_cart(data) for data in args['orders']]
+
+        # Resolve the users and the items of every order at once
+        valid_carts = [cart for cart in carts if cart is not None]
+        users = fetch_users({user_uuid for user_uuid, _ in valid_carts})
+        items = catalog.get_items(set().union(*(quantities for _, quantities in valid_carts)))
+
+        results = []
+        orders = []
+        for cart in carts:
+            if cart is None:
+                results.append({'status': BAD_REQUEST, 'error': 'invalid order'})
+                continue
+
+            user_uuid, quantities = cart
+            user = users.get(user_uuid)
+            if user is None:
+                results.append({'status': BAD_REQUEST, 'error': 'unknown user'})
+                continue
+
+            lines = price_lines(quantities, items)
+            if lines is None:
+                results.append({'status': BAD_REQUEST, 'error': 'invalid items'})
+                continue
+
+            results.append(None)
+            orders.append((user, lines))
+
+        created = iter(write_orders(orders))
+        results = [result or write_result(next(created)) for result in results]
+
+        return results, OK
+
+    @staticmethod
+    def _parse_cart(data):
+        try:
+            user_uuid = str(is_valid_uuid(data['user']))
+            quantities = cart_quantities(data['items'])
+        except (TypeError, ValueError, AttributeError, KeyError):
+            return None
+
+        if quantities is None:
+            return None
+
+        return user_uuid, quantities
 
 
 class OrderResource(Resource):
     def get(self, uuid):
+        args = ORDER_QUERY_SCHEMA.parse()
+
         try:
-            return Order.get(uuid=uuid).json(), OK
+            shard, order = find_order(uuid, Order.select_json(args['fields']))
         except Order.DoesNotExist:
             return None, NOT_FOUND
 
+        etag = conditional.row_etag(order)
+        response = conditional.not_modified(etag)
+        if response is not None:
+            return response
+
+        with orders_database.using(shard):
+            data = order.json(args['fields'])
+        return data, OK, conditional.headers(etag)
+
     def put(self, uuid):
         try:
-            order = Order.get(uuid=uuid)
+            shard, order = find_order(uuid)
         except Order.DoesNotExist:
             return None, NOT_FOUND
 
-        parser = reqparse.RequestParser()
-        parser.add_argument('items', type=is_valid_item_list, required=True)
-        args = parser.parse_args(strict=True)
+        args = ORDER_ITEMS_SCHEMA.parse()
 
-        total_price = 0
-
-        items = args['items']
-        uuid = [i[0] for i in items]
-        items_query = Item.select().where(Item.uuid << uuid)
-
-        if items_query.count() != len(items) or len(items) == 0:
+        lines = order_lines(args['items'])
+        if lines is None:
             return None, BAD_REQUEST
 
-        for item in items_query:
-            item_quantity = [x[1] for x in items if x[0] == str(item.uuid)][0]
-            total_price += float(item.price * item_quantity)
-
-        with database.transaction():
-            OrderItem.delete().where(OrderItem.id == order.id).execute()
-
-            for item in items_query:
-                item_quantity = [x[1] for x in items if x[0] == str(item.uuid)][0]
-                OrderItem.create(
-                    order=order.id,
-                    item=item.id,
-                    quantity=item_quantity,
-                    subtotal=float(item.price * item_quantity)
-                )
-
-            order.total_price = total_price
-            order.save()
-
+        writer.submit_to_shard(shard, update_order, order, order.user, lines)
         return order.json(), OK
 
     def delete(self, uuid):
         try:
-            order = Order.get(Order.uuid == uuid)
+            shard, order = find_order(uuid)
         except Order.DoesNotExist:
             return None, NOT_FOUND
 
-        with database.transaction():
-            order_items = OrderItem.select().where(
-                OrderItem.id == order.id)
-
-            for order_item in order_items:
-                order_item.delete_instance()
-
-            order.delete_instance()
-
+        writer.submit_to_shard(shard, delete_order, order)
         return None, NO_CONTENT
@@ -0,0 +1,101 @@
+import os
+import uuid
+from flask import request, send_file
+from flask_restful import Resource
+from http.client import CREATED, NO_CONTENT, NOT_FOUND, OK
+from http.client import REQUEST_ENTITY_TOO_LARGE, BAD_REQUEST, UNSUPPORTED_MEDIA_TYPE
+from models import Item, Picture
+import pictures
+from schemas import Schema, Field, ARGS
+import utils
+import writer
+
+# The file of a picture never changes, a new picture gets a new uuid
+CACHE_TIMEOUT = 365 * 24 * 60 * 60
+
+
+UPLOAD_QUERY_SCHEMA = Schema(
+    title=Field(utils.non_empty_str, required=True, location=ARGS),
+)
+
+PICTURE_QUERY_SCHEMA = Schema(
+    size=Field(choices=pictures.THUMBNAIL_SIZES, location=ARGS),
+)
+
+
+class ItemPicturesResource(Resource):
+    def get(self, item_id):
+        try:
+            item = Item.get(Item.uuid == item_id)
+        except Item.DoesNotExist:
+            return None, NOT_FOUND
+
+        query = Picture.select().where(Picture.item == item.id).order_by(Picture.id)
+        return [picture.json() for picture in query], OK
+
+    def post(self, item_id):
+        # The body is the picture, only the query string is parsed
+        args = UPLOAD_QUERY_SCHEMA.parse()
+
+        if request.mimetype not in pictures.FORMATS:
+            return None, UNSUPPORTED_MEDIA_TYPE
+
+        try:
+            item = Item.get(Item.uuid == item_id)
+        except Item.DoesNotExist:
+            return None, NOT_FOUND
+
+        # The body is copied to disk as it is read, never held in memory
+        picture_uuid = uuid.uuid4()
+        try:
+            extension = pictures.save(request.stream, picture_uuid, request.mimetype)
+        except pictures.PictureTooLarge:
+            return None, REQUEST_ENTITY_TOO_LARGE
+        except pictures.InvalidPicture:
+            return None, BAD_REQUEST
+
+        try:
+            picture = writer.submit(
+                Picture.create,
+                uuid=picture_uuid,
+                title=args['title'],
+                extension=extension,
+                item=item.id,
+            )
+        except Exception:
+            pictures.delete(picture_uuid, extension)
+            raise
+
+        pictures.submit(picture_uuid, extension)
+        return picture.json(), CREATED
+
+
+class PictureResource(Resource):
+    def get(self, uuid):
+        args = PICTURE_QUERY_SCHEMA.parse()
+
+        try:
+            picture = Picture.get(Picture.uuid == uuid)
+        except Picture.DoesNotExist:
+            return None, NOT_FOUND
+
+        # send_file hands the file to the server's file wrapper (sendfile
+        # under most WSGI servers) or to the front proxy with X-Sendfile,
+        # and answers conditional and Range requests
+        path = os.path.abspath(pictures.path(picture.uuid, picture.extension, args['size']))
+        try:
+            return send_file(path, mimetype=pictures.mimetype(picture.extension),
+                             conditional=True, cache_timeout=CACHE_TIMEOUT)
+        except FileNotFoundError:
+            # The thumbnails are not made yet
+            return None, NOT_FOUND
+
+    def delete(self, uuid):
+        try:
+            picture = Picture.get(Picture.uuid == uuid)
+        except Picture.DoesNotExist:
+            return None, NOT_FOUND
+
+        writer.submit(picture.delete_instance)
+        pictures.delete(picture.uuid, picture.extension)
+        return None, NO_CONTENT
@@ -0,0 +1,19 @@
+from flask_restful import Resource
+from http.client import OK
+from models import database, orders_database
+import hashing
+
+
+class StatsResource(Resource):
+    def get(self):
+        """
+        Counters of the worker and connection pools, for the operators. A
+        worker pool that is not running is reported as null.
+        """
+        stats = {
+            'hashing': hashing.stats(),
+            'database': database.stats(),
+        }
+        if len(orders_database) > 1:
+            stats['order_shards'] = [shard.stats() for shard in orders_database.databases]
+        return stats, OK
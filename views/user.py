@@ -2,44 +2,58 @@ import uuid
 from models import User
 import auth
 from flask import g
-from http.client import CREATED, NOT_FOUND, NO_CONTENT, BAD_REQUEST, UNAUTHORIZED
-from flask_restful import Resource, reqparse
+from http.client import CREATED, NOT_FOUND, NO_CONTENT, UNAUTHORIZED, OK
+from flask_restful import Resource
 import re
-from passlib.hash import pbkdf2_sha256
+import hashing
+from schemas import Schema, Field, ARGS
 import utils
+import writer
+
+
+EMAIL_RE = re.compile(r'[a-z]{3,}(?P<at>@)[a-z]{3,}(?P<point>\.)[a-z]{2,}')
 
 
 def valid_email(email):
-    return re.match('[a-z]{3,}(?P<at>@)[a-z]{3,}(?P<point>\.)[a-z]{2,}', email)
+    return EMAIL_RE.match(email)
+
+
+def email_address(value):
+    email = utils.non_empty_str(value)
+    if not valid_email(email):
+        raise ValueError('{} is not a valid email address'.format(email))
+    return email
 
 
 def crypt_password(password):
-    crypt = pbkdf2_sha256.hash(password)
+    crypt = hashing.hash_password(password)
 
     return crypt
 
 
+USER_SCHEMA = Schema(
+    first_name=Field(utils.non_empty_str, required=True),
+    last_name=Field(utils.non_empty_str, required=True),
+    email=Field(email_address, required=True),
+    password=Field(utils.non_empty_str, required=True, min_length=7),
+    fields=Field(utils.field_list(User.json_fields), location=ARGS),
+)
+
+
 class UsersResource(Resource):
     def post(self):
-        parser = reqparse.RequestParser()
-        parser.add_argument('first_name', type=utils.non_empty_str, required=True)
-        parser.add_argument('last_name', type=utils.non_empty_str, required=True)
-        parser.add_argument('email', type=utils.non_empty_str, required=True)
-        parser.add_argument('password', type=utils.non_empty_str, required=True)
-        args = parser.parse_args(strict=True)
-
-        if valid_email(args['email']) and len(args['password']) > 6:
-            obj = User.create(
-                uuid=uuid.uuid4(),
-                first_name=args['first_name'],
-                last_name=args['last_name'],
-                email=args['email'],
-                password=crypt_password(args['password'])
-            )
-
-            return obj.json(), CREATED
-        else:
-            return '', BAD_REQUEST
+        args = USER_SCHEMA.parse()
+
+        obj = writer.submit(
+            User.create,
+            uuid=uuid.uuid4(),
+            first_name=args['first_name'],
+            last_name=args['last_name'],
+            email=args['email'],
+            password=crypt_password(args['password'])
+        )
+
+        return obj.json(args['fields']), CREATED
 
 
 class UserResource(Resource):
@@ -50,26 +64,19 @@ class UserResource(Resource):
         except User.DoesNotExist:
             return None, NOT_FOUND
 
-        if obj != g.current_user:
+        if obj.uuid != g.current_user_uuid:
             return '', UNAUTHORIZED
 
-        parser = reqparse.RequestParser()
-        parser.add_argument('first_name', type=utils.non_empty_str, required=True)
-        parser.add_argument('last_name', type=utils.non_empty_str, required=True)
-        parser.add_argument('email', type=utils.non_empty_str, required=True)
-        parser.add_argument('password', type=utils.non_empty_str, required=True)
-        args = parser.parse_args(strict=True)
+        args = USER_SCHEMA.parse()
 
-        if valid_email(args['email']) is not None and len(args['password']) > 6:
-            obj.first_name = args['first_name']
-            obj.last_name = args['last_name']
-            obj.email = args['email']
-            obj.password = crypt_password(args['password'])
-            obj.save()
+        obj.first_name = args['first_name']
+        obj.last_name = args['last_name']
+        obj.email = args['email']
+        obj.password = crypt_password(args['password'])
+        writer.submit(obj.save)
+        auth.invalidate(obj)
 
-            return obj.json(), CREATED
-        else:
-            return '', BAD_REQUEST
+        return obj.json(args['fields']), CREATED
 
     @auth.login_required
     def delete(self, uuid):
@@ -78,8 +85,20 @@ class UserResource(Resource):
         except User.DoesNotExist:
             return None, NOT_FOUND
 
-        if obj != g.current_user:
+        if obj.uuid != g.current_user_uuid:
             return '', UNAUTHORIZED
 
-        obj.delete_instance()
+        writer.submit(obj.delete_instance)
+        auth.invalidate(obj)
         return None, NO_CONTENT
+
+
+class LoginResource(Resource):
+    @auth.basic_auth.login_required
+    def post(self):
+        # Trade the credentials for a token, so that the following requests
+        # skip the password verification
+        return {
+            'token': auth.generate_token(g.current_user),
+            'expires_in': auth.TOKEN_TTL,
+        }, OK
@@ -0,0 +1,175 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+from peewee import OperationalError
+
+from models import database, orders_database
+
+MAX_BATCH_SIZE = 100
+MAX_RETRIES = 10
+RETRY_DELAY = 0.005
+
+
+def is_busy(exc):
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+class WriteCoordinator:
+    """
+    Single writer thread executing the submitted writes. The writes waiting
+    in the queue are grouped in a shared transaction (group commit), each
+    one in its own savepoint so that a failing write does not abort the
+    others. A batch hitting SQLITE_BUSY is retried as a whole.
+    """
+
+    def __init__(self, database, max_batch_size=MAX_BATCH_SIZE,
+                 max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
+        self.database = database
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.batches = 0
+        self.writes = 0
+        self.retries = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='write-coordinator', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future.result()
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'retries': self.retries,
+            'queued': self._queue.qsize(),
+        }
+
+    def _run(self):
+        if self.database.is_closed():
+            self.database.connect()
+
+        running = True
+        while running:
+            task = self._queue.get()
+            if task is None:
+                break
+
+            batch = [task]
+            while len(batch) < self.max_batch_size:
+                try:
+                    task = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if task is None:
+                    running = False
+                    break
+                batch.append(task)
+
+            self._commit(batch)
+
+        self.database.close()
+
+    def _commit(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                results = self._execute(batch)
+                break
+            except OperationalError as exc:
+                if not is_busy(exc) or attempt == self.max_retries:
+                    return self._fail(batch, exc)
+                self.retries += 1
+                time.sleep(self.retry_delay * 2 ** attempt)
+            except Exception as exc:
+                return self._fail(batch, exc)
+
+        self.batches += 1
+        self.writes += len(batch)
+        for (future, _, _, _), (failed, value) in zip(batch, results):
+            if failed:
+                future.set_exception(value)
+            else:
+                future.set_result(value)
+
+    def _fail(self, batch, exc):
+        for future, _, _, _ in batch:
+            future.set_exception(exc)
+
+    def _execute(self, batch):
+        results = []
+        with self.database.atomic():
+            for _, fn, args, kwargs in batch:
+                try:
+                    with self.database.atomic():
+                        results.append((False, fn(*args, **kwargs)))
+                except OperationalError as exc:
+                    if is_busy(exc):
+                        raise
+                    results.append((True, exc))
+                except Exception as exc:
+                    results.append((True, exc))
+        return results
+
+
+_coordinator = None
+# One coordinator per order shard, so that the shards commit in parallel
+_shard_coordinators = []
+
+
+def start(**kwargs):
+    global _coordinator, _shard_coordinators
+    _coordinator = WriteCoordinator(database, **kwargs)
+    _coordinator.start()
+    if len(orders_database) > 1:
+        _shard_coordinators = [WriteCoordinator(shard, **kwargs)
+                               for shard in orders_database.databases]
+        for coordinator in _shard_coordinators:
+            coordinator.start()
+
+
+def stop():
+    global _coordinator, _shard_coordinators
+    if _coordinator is not None:
+        _coordinator.stop()
+        _coordinator = None
+    for coordinator in _shard_coordinators:
+        coordinator.stop()
+    _shard_coordinators = []
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Run the database write `fn`, on the writer thread when the coordinator
+    is running or right away otherwise. Return its result or raise its
+    exception. When the write is retried it is run again, so `fn` must not
+    depend on the state left by a previous attempt.
+    """
+    if _coordinator is None:
+        return fn(*args, **kwargs)
+    return _coordinator.submit(fn, *args, **kwargs)
+
+
+def submit_to_shard(shard, fn, *args, **kwargs):
+    """Like submit, for a write to the order `shard`, run within it."""
+    def write():
+        with orders_database.using(shard):
+            return fn(*args, **kwargs)
+
+    if _shard_coordinators:
+        return _shard_coordinators[shard].submit(write)
+    return submit(write)